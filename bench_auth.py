@@ -0,0 +1,128 @@
+# 设备认证基准测试：对比令牌缓存冷/热时的 WebSocket 握手速率
+# 用法: python bench_auth.py [--devices 2000] [--batch 200]
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Tuple
+import aiohttp
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt import JWT, jwk_from_pem
+from bench_runtime import free_port, wait_ready
+from utils import generate_uuid
+
+
+# 生成签名密钥，并把公钥写入 JWKS 文件
+def create_signing_key(jwks_path: str, kid: str = "bench"):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    jwk = jwk_from_pem(pem)
+    with open(jwks_path, "w", encoding="utf-8") as f:
+        json.dump({"keys": [{**jwk.to_dict(public_only=True), "kid": kid}]}, f)
+    return jwk, kid
+
+# 为每台设备签发令牌
+def issue_tokens(jwk, kid: str, count: int) -> List[Tuple[str, str]]:
+    issuer = JWT()
+    expire_at = int(time.time()) + 3600
+    tokens = []
+    for _ in range(count):
+        device_id = generate_uuid()
+        token = issuer.encode({"sub": device_id, "exp": expire_at}, jwk, alg="RS256", optional_headers={"kid": kid})
+        tokens.append((device_id, token))
+    return tokens
+
+# 启动被测服务
+def start_server(port: int, auth_enabled: bool, jwks_path: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("VIDEO_RTMP_HOST", "127.0.0.1")
+    env.setdefault("VIDEO_RTMP_PORT", "1935")
+    env.update({
+        "DEBUG": "false",
+        "DEVICE_AUTH_ENABLED": "true" if auth_enabled else "false",
+        "DEVICE_AUTH_JWKS_PATH": jwks_path,
+    })
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+# 一轮握手：所有设备分批建立连接（收到服务端接受即计为成功）后断开
+async def handshake_round(ws_base_url: str, tokens: List[Tuple[str, str]], batch: int) -> Dict[str, float]:
+    succeeded = 0
+    failed = 0
+
+    async def handshake(session: aiohttp.ClientSession, device_id: str, token: str):
+        nonlocal succeeded, failed
+        url = f"{ws_base_url}/api/ws/v1/manyRoom/bench/{device_id[:16]}/device/{device_id}/zh-CN"
+        try:
+            ws = await session.ws_connect(url, headers={"Authorization": f"Bearer {token}"}, heartbeat=None)
+            succeeded += 1
+            await ws.close()
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            failed += 1
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        start = time.monotonic()
+        for offset in range(0, len(tokens), batch):
+            await asyncio.gather(*(
+                handshake(session, device_id, token)
+                for device_id, token in tokens[offset:offset + batch]
+            ))
+        elapsed = time.monotonic() - start
+    return {"succeeded": succeeded, "failed": failed, "rate": succeeded / elapsed}
+
+async def run(args, auth_enabled: bool, jwks_path: str, tokens) -> List[Tuple[str, Dict[str, float]]]:
+    port = free_port()
+    process = start_server(port, auth_enabled, jwks_path)
+    try:
+        await wait_ready(f"http://127.0.0.1:{port}")
+        ws_base_url = f"ws://127.0.0.1:{port}"
+        if not auth_enabled:
+            return [("认证关闭", await handshake_round(ws_base_url, tokens, args.batch))]
+        cold = await handshake_round(ws_base_url, tokens, args.batch)
+        hot = await handshake_round(ws_base_url, tokens, args.batch)
+        return [("认证开启，缓存冷", cold), ("认证开启，缓存热", hot)]
+    finally:
+        process.terminate()
+        process.wait()
+
+async def main():
+    parser = argparse.ArgumentParser(description="对比设备认证缓存冷/热时的握手速率")
+    parser.add_argument("--devices", type=int, default=2000, help="设备数")
+    parser.add_argument("--batch", type=int, default=200, help="每批并发握手数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        jwks_path = os.path.join(tmpdir, "device_keys.json")
+        jwk, kid = create_signing_key(jwks_path)
+        print(f"签发 {args.devices} 个令牌 ...", flush=True)
+        tokens = issue_tokens(jwk, kid, args.devices)
+
+        results = await run(args, False, jwks_path, tokens)
+        results += await run(args, True, jwks_path, tokens)
+
+    print("\n| 场景 | 成功 | 失败 | 握手/秒 |")
+    print("|------|-----:|-----:|-------:|")
+    for name, r in results:
+        print(f"| {name} | {r['succeeded']} | {r['failed']} | {r['rate']:.0f} |")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
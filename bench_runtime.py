@@ -0,0 +1,156 @@
+# 运行时基准测试：对比默认配置与生产模式（uvloop + httptools + orjson）的吞吐和连接容量
+# 用法: python bench_runtime.py [--duration 10] [--concurrency 64] [--connections 2000]
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from typing import Dict, List
+import aiohttp
+from utils import generate_uuid
+
+
+# 待对比的运行配置
+PROFILES = {
+    "default": {
+        "args": ["--loop", "asyncio", "--http", "h11"],
+        "env": {"DEBUG": "true", "PRODUCTION": "false"},
+    },
+    "production": {
+        "args": ["--loop", "auto", "--http", "httptools", "--no-access-log"],
+        "env": {"DEBUG": "false", "PRODUCTION": "true"},
+    },
+}
+
+# 获取一个空闲端口
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# 启动被测服务进程
+def start_server(profile: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault("VIDEO_RTMP_HOST", "127.0.0.1")
+    env.setdefault("VIDEO_RTMP_PORT", "1935")
+    env.update(PROFILES[profile]["env"])
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning",
+            *PROFILES[profile]["args"],
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+# 等待服务就绪
+async def wait_ready(base_url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/") as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("服务启动超时")
+
+# HTTP 吞吐测试：并发请求 online-monitor 接口
+async def bench_http(base_url: str, duration: float, concurrency: int) -> Dict[str, float]:
+    url = f"{base_url}/api/v1/online-monitor"
+    payload = {"type": "get_device_list", "data": {}}
+    count = 0
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker(session: aiohttp.ClientSession):
+        nonlocal count, errors
+        while time.monotonic() < deadline:
+            try:
+                async with session.post(url, json=payload) as resp:
+                    await resp.read()
+                    if resp.status == 200:
+                        count += 1
+                    else:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.monotonic()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.monotonic() - start
+    return {"requests": count, "errors": errors, "rps": count / elapsed}
+
+# 连接容量测试：建立大量设备 WebSocket 连接并保持
+async def bench_connections(ws_base_url: str, connections: int, batch: int = 200) -> Dict[str, float]:
+    sockets: List[aiohttp.ClientWebSocketResponse] = []
+    failures = 0
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+
+    async def open_one():
+        nonlocal failures
+        device_id = generate_uuid()
+        url = f"{ws_base_url}/api/ws/v1/manyRoom/bench/{device_id[:16]}/device/{device_id}/zh-CN"
+        try:
+            ws = await session.ws_connect(url, heartbeat=None)
+            await ws.send_json({"type": "notify", "event": "join", "deviceId": device_id, "playId": device_id})
+            sockets.append(ws)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            failures += 1
+
+    start = time.monotonic()
+    try:
+        for offset in range(0, connections, batch):
+            await asyncio.gather(*(open_one() for _ in range(min(batch, connections - offset))))
+        elapsed = time.monotonic() - start
+    finally:
+        await asyncio.gather(*(ws.close() for ws in sockets), return_exceptions=True)
+        await session.close()
+    return {"opened": len(sockets), "failures": failures, "connect_rate": len(sockets) / elapsed}
+
+async def run_profile(profile: str, args) -> Dict[str, float]:
+    port = free_port()
+    process = start_server(profile, port)
+    try:
+        await wait_ready(f"http://127.0.0.1:{port}")
+        http_result = await bench_http(f"http://127.0.0.1:{port}", args.duration, args.concurrency)
+        conn_result = await bench_connections(f"ws://127.0.0.1:{port}", args.connections)
+        return {**http_result, **conn_result}
+    finally:
+        process.terminate()
+        process.wait()
+
+async def main():
+    parser = argparse.ArgumentParser(description="对比默认配置与生产模式的吞吐和连接容量")
+    parser.add_argument("--duration", type=float, default=10.0, help="HTTP 压测时长（秒）")
+    parser.add_argument("--concurrency", type=int, default=64, help="HTTP 并发数")
+    parser.add_argument("--connections", type=int, default=2000, help="WebSocket 目标连接数")
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    args = parser.parse_args()
+
+    results = {}
+    for profile in args.profiles:
+        print(f"运行配置 {profile} ...", flush=True)
+        results[profile] = await run_profile(profile, args)
+
+    print("\n| 配置 | 请求/秒 | 请求错误 | 已建立连接 | 连接失败 | 建连/秒 |")
+    print("|------|--------:|--------:|----------:|--------:|-------:|")
+    for profile, r in results.items():
+        print(
+            f"| {profile} | {r['rps']:.0f} | {r['errors']} | {r['opened']} "
+            f"| {r['failures']} | {r['connect_rate']:.0f} |"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
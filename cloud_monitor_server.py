@@ -1,22 +1,23 @@
 import json
 import logging
+import orjson
 from typing import Optional
 from fastapi import HTTPException, APIRouter
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from models import MonitorMsgType, MonitorRequest, MonitorResponse
 from connection_manager import connectionManager
 
 
 logger = logging.getLogger(__name__)
 
-cloud_monitor_router = APIRouter()
+cloud_monitor_router = APIRouter(default_response_class=ORJSONResponse)
 
 @cloud_monitor_router.post("/online-monitor")
 async def cloud_monitor_handler(request: dict):
     try:
         monitor_request = MonitorRequest(**request)
         response = await handle_monitor_message(monitor_request)
-        return JSONResponse(content=response or {})
+        return ORJSONResponse(content=response or {})
     except Exception as e:
         logger.error(f"获取设备状态失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -41,21 +42,81 @@ async def handle_monitor_message(request: MonitorRequest) -> Optional[MonitorRes
 
 
 # 获取设备列表
+# 请求可携带上次响应中的 version：未变化时返回 304，否则尽量只返回此后变化的设备
 async def handle_get_device_list(request: MonitorRequest) -> dict:
-    device_list = connectionManager.get_device_list()
+    generation = connectionManager.generation
+    version = connectionManager.format_version(generation)
+    since = connectionManager.parse_version(request.data.get("version"))
+
+    if since == generation:
+        resp = MonitorResponse(
+            type=request.type,
+            code=304,
+            info="not modified",
+            data={"version": version},
+        )
+        return resp.model_dump()
+
+    changes = connectionManager.get_device_changes(since) if since is not None else None
+    if changes is not None:
+        changed, removed = changes
+        data = {
+            "version": version,
+            "full": False,
+            "devices": orjson.Fragment(changed),
+            "removed": removed,
+        }
+    else:
+        data = {
+            "version": version,
+            "full": True,
+            "devices": orjson.Fragment(connectionManager.get_device_list_snapshot()),
+        }
     resp = MonitorResponse(
         type=request.type,
-        data=device_list,
+        data=data,
     )
     return resp.model_dump()
 
 # 获取设备状态
+# 请求可携带上次响应中的 version：设备状态未变化时返回 304
 async def handle_get_device_status(request: MonitorRequest) -> dict:
     device_id = request.data.get("device_id")
-    device_status = connectionManager.get_device_status(device_id)
+    snapshot = connectionManager.get_device_snapshot(device_id)
+    if snapshot is None:
+        resp = MonitorResponse(
+            type=request.type,
+            code=404,
+            info="设备未连接",
+            data={"device_id": device_id},
+        )
+        return resp.model_dump()
+
+    generation = connectionManager.get_device_generation(device_id)
+    version = connectionManager.format_version(generation)
+    if connectionManager.parse_version(request.data.get("version")) == generation:
+        resp = MonitorResponse(
+            type=request.type,
+            code=304,
+            info="not modified",
+            data={"version": version},
+        )
+        return resp.model_dump()
+
+    resp = MonitorResponse(
+        type=request.type,
+        data={
+            "version": version,
+            "status": orjson.Fragment(snapshot),
+        },
+    )
+    return resp.model_dump()
+
+# 获取设备信息轮询统计
+async def handle_get_poll_stats(request: MonitorRequest) -> dict:
     resp = MonitorResponse(
         type=request.type,
-        data=device_status,
+        data=connectionManager.get_poll_stats(),
     )
     return resp.model_dump()
 
@@ -63,4 +124,5 @@ async def handle_get_device_status(request: MonitorRequest) -> dict:
 HANDLER_MAP = {
     MonitorMsgType.GET_DEVICE_LIST: handle_get_device_list,
     MonitorMsgType.GET_DEVICE_STATUS: handle_get_device_status,
+    MonitorMsgType.GET_POLL_STATS: handle_get_poll_stats,
 }
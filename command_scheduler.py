@@ -0,0 +1,298 @@
+import math
+import time
+import heapq
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+from config import settings
+from utils import generate_uuid
+from models import ScheduleJobRequest, ScheduleJobState, ScheduleJobStatus
+from connection_manager import connectionManager
+
+
+logger = logging.getLogger(__name__)
+
+# 分批下发的时间粒度（秒）：速率较高时每个时间片合并下发多台设备
+SCHEDULE_TICK = 0.05
+
+
+'''
+定时批量控制任务
+'''
+class ScheduledJob:
+    # 构造函数
+    def __init__(self, job_id: str, request: ScheduleJobRequest):
+        self.job_id = job_id
+        self.request = request
+        self.template = request.message.model_dump()
+        self.state = ScheduleJobState.SCHEDULED
+        self.start_at = request.start_at or time.time()
+        self.expire_at = self.start_at + request.retry_ttl
+        # 当前在堆中的触发时间（None 表示不在堆中）
+        self.deadline: Optional[float] = None
+        # 待下发设备与等待上线的设备
+        self.pending: Deque[str] = deque(dict.fromkeys(request.device_ids))
+        self.waiting: Set[str] = set()
+        # 每批设备数与批间隔（开始时根据设备数、打散窗口和速率计算）
+        self.batch = 0
+        self.interval = 0.0
+        # 统计
+        self.total = len(self.pending)
+        self.sent = 0
+        self.failed = 0
+        self.expired = 0
+
+    # 任务进度
+    def status(self) -> ScheduleJobStatus:
+        return ScheduleJobStatus(
+            job_id=self.job_id,
+            state=self.state,
+            event=self.template["event"],
+            start_at=int(self.start_at),
+            total=self.total,
+            sent=self.sent,
+            pending=len(self.pending),
+            waiting=len(self.waiting),
+            failed=self.failed,
+            expired=self.expired,
+        )
+
+
+'''
+定时批量控制调度器：按截止时间堆调度任务，任务在打散窗口内按速率分批下发
+'''
+class CommandScheduler:
+    # 构造函数
+    def __init__(self):
+        # 未结束的任务
+        self._active: Dict[str, ScheduledJob] = {}
+        # 已结束的任务（按结束顺序，超出上限淘汰最早的记录）
+        self._finished: "OrderedDict[str, ScheduledJob]" = OrderedDict()
+        # 截止时间堆：(触发时间, 序号, 任务ID)，每个任务只有一个有效条目，过期条目惰性丢弃
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        # 等待上线的设备 -> 任务ID集合
+        self._waiting: Dict[str, Set[str]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # 启动调度器
+    async def start(self):
+        """启动调度任务，并注册设备上线回调"""
+        self._wakeup = asyncio.Event()
+        connectionManager.add_connect_listener(self._on_device_connected)
+        self._task = asyncio.create_task(self._run())
+        logger.info("命令调度器已启动")
+
+    # 停止调度器
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # 提交任务
+    def submit(self, request: ScheduleJobRequest) -> ScheduleJobStatus:
+        """提交定时批量控制任务"""
+        if not request.device_ids and not request.all_devices:
+            raise ValueError("未指定目标设备")
+        if len(request.device_ids) > settings.scheduler_max_job_devices:
+            raise ValueError(f"目标设备数超过上限 {settings.scheduler_max_job_devices}")
+        if len(self._active) >= settings.scheduler_max_jobs:
+            raise ValueError(f"未结束的任务数超过上限 {settings.scheduler_max_jobs}")
+
+        job = ScheduledJob(generate_uuid(), request)
+        self._active[job.job_id] = job
+        self._schedule(job, job.start_at)
+        logger.info(f"定时任务已提交: {job.job_id}, 事件 {job.template['event']}, 设备 {job.total} 台")
+        return job.status()
+
+    # 取消任务
+    def cancel(self, job_id: str) -> Optional[ScheduleJobStatus]:
+        job = self._active.get(job_id)
+        if job is None:
+            job = self._finished.get(job_id)
+            return job.status() if job else None
+        job.pending.clear()
+        self._release_waiting(job)
+        self._finish(job, ScheduleJobState.CANCELLED)
+        logger.info(f"定时任务已取消: {job_id}")
+        return job.status()
+
+    # 查询任务进度
+    def get_status(self, job_id: str) -> Optional[ScheduleJobStatus]:
+        job = self._active.get(job_id) or self._finished.get(job_id)
+        return job.status() if job else None
+
+    # 查询所有任务进度
+    def list_status(self) -> List[ScheduleJobStatus]:
+        return [job.status() for job in (*self._active.values(), *self._finished.values())]
+
+    # 设备上线：把等待中的任务重新加入下发队列
+    def _on_device_connected(self, device_id: str):
+        job_ids = self._waiting.pop(device_id, None)
+        if not job_ids:
+            return
+        now = time.time()
+        for job_id in job_ids:
+            job = self._active.get(job_id)
+            if job is None or device_id not in job.waiting:
+                continue
+            job.waiting.discard(device_id)
+            job.pending.append(device_id)
+            job.state = ScheduleJobState.RUNNING
+            self._schedule(job, now)
+
+    # 加入截止时间堆（只会提前已有的触发时间）
+    def _schedule(self, job: ScheduledJob, when: float):
+        if job.deadline is not None and job.deadline <= when:
+            return
+        job.deadline = when
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, job.job_id))
+        # 过期条目过多时重建堆，保证堆大小与任务数同量级
+        if len(self._heap) > 2 * len(self._active) + 64:
+            self._heap = [
+                entry for entry in self._heap
+                if entry[2] in self._active and self._active[entry[2]].deadline == entry[0]
+            ]
+            heapq.heapify(self._heap)
+        if self._wakeup and self._heap[0][2] == job.job_id:
+            self._wakeup.set()
+
+    # 调度循环
+    async def _run(self):
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            when, _, job_id = self._heap[0]
+            delay = when - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            heapq.heappop(self._heap)
+            job = self._active.get(job_id)
+            if job is None or job.deadline != when:
+                continue
+            job.deadline = None
+            try:
+                await self._fire(job)
+            except Exception as e:
+                logger.error(f"执行定时任务 {job_id} 时出错: {e}")
+
+    # 开始任务：确定目标设备和下发节奏
+    def _begin(self, job: ScheduledJob):
+        request = job.request
+        if request.all_devices:
+            targets = set(job.pending)
+            online = [
+                device_id for device_id in connectionManager.get_device_list()
+                if device_id not in targets
+            ]
+            # 与指定设备列表相同的目标设备数上限
+            capacity = max(0, settings.scheduler_max_job_devices - len(job.pending))
+            if len(online) > capacity:
+                logger.warning(
+                    f"定时任务 {job.job_id} 的在线设备数 {len(targets) + len(online)} "
+                    f"超过上限 {settings.scheduler_max_job_devices}，只下发前 {settings.scheduler_max_job_devices} 台"
+                )
+                online = online[:capacity]
+            job.pending.extend(online)
+            job.total = len(job.pending)
+
+        if request.jitter_window > 0:
+            # 打散顺序，避免每次都是同一批设备先收到
+            devices = list(job.pending)
+            random.shuffle(devices)
+            job.pending = deque(devices)
+
+        rate = request.rate if request.rate > 0 else math.inf
+        if request.jitter_window > 0 and job.total:
+            rate = min(rate, job.total / request.jitter_window)
+        if math.isinf(rate):
+            job.batch = max(1, job.total)
+            job.interval = 0.0
+        else:
+            job.batch = max(1, math.ceil(rate * SCHEDULE_TICK))
+            job.interval = job.batch / rate
+        job.state = ScheduleJobState.RUNNING
+
+    # 执行一批下发
+    async def _fire(self, job: ScheduledJob):
+        if job.state == ScheduleJobState.SCHEDULED:
+            self._begin(job)
+
+        batch = [job.pending.popleft() for _ in range(min(job.batch, len(job.pending)))]
+        if batch:
+            await asyncio.gather(*(self._send(job, device_id) for device_id in batch))
+
+        now = time.time()
+        if job.waiting and now >= job.expire_at:
+            job.expired += len(job.waiting)
+            self._release_waiting(job)
+
+        if job.job_id not in self._active:
+            return  # 下发期间任务被取消
+        if job.pending:
+            self._schedule(job, now + job.interval)
+        elif job.waiting:
+            job.state = ScheduleJobState.WAITING
+            self._schedule(job, job.expire_at)
+        else:
+            self._finish(job, ScheduleJobState.COMPLETED)
+
+    # 下发到单台设备
+    async def _send(self, job: ScheduledJob, device_id: str):
+        if connectionManager.connected(device_id):
+            message = dict(job.template, deviceId=device_id, playId=device_id)
+            try:
+                await connectionManager.send_message(device_id, message)
+                job.sent += 1
+                return
+            except Exception as e:
+                logger.warning(f"定时任务 {job.job_id} 下发到 {device_id} 失败: {e}")
+
+        if job.job_id not in self._active:
+            return  # 下发期间任务被取消
+        if job.request.retry_on_reconnect and time.time() < job.expire_at:
+            job.waiting.add(device_id)
+            self._waiting.setdefault(device_id, set()).add(job.job_id)
+        else:
+            job.failed += 1
+
+    # 清除任务的等待设备
+    def _release_waiting(self, job: ScheduledJob):
+        for device_id in job.waiting:
+            job_ids = self._waiting.get(device_id)
+            if job_ids:
+                job_ids.discard(job.job_id)
+                if not job_ids:
+                    del self._waiting[device_id]
+        job.waiting.clear()
+
+    # 结束任务
+    def _finish(self, job: ScheduledJob, state: ScheduleJobState):
+        job.state = state
+        job.deadline = None
+        self._active.pop(job.job_id, None)
+        self._finished[job.job_id] = job
+        while len(self._finished) > settings.scheduler_job_history:
+            self._finished.popitem(last=False)
+        logger.info(f"定时任务结束: {job.job_id}, 状态 {state.value}, 已下发 {job.sent}/{job.total}")
+
+
+# 全局命令调度器
+commandScheduler = CommandScheduler()
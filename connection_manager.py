@@ -1,16 +1,21 @@
 import json
+import time
 import asyncio
 import logging
-from typing import Dict, Optional, List
-from urllib import request
-from utils import current_timestamp_s
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, List, Tuple
+import orjson
+from utils import current_timestamp_s, generate_uuid
 from fastapi import WebSocket
 from fastapi.websockets import WebSocketState
-import redis.asyncio as redis
 from config import settings
-from models import DeviceInfo, DriftMessage
+from traffic_recorder import trafficRecorder, FrameDirection
+from pending_command_store import PendingCommandStore
+from device_twin import DeviceTwinManager
+from device_info_poller import DeviceInfoPoller
+from models import DeviceInfo
 from models import (
-    DriftEvent, DriftMsgType, DeviceStatus
+    DriftEvent, DriftMsgType, DeviceStatus, CommandDelivery, DeviceTwinStatus
 )
 
 
@@ -28,10 +33,33 @@ class ConnectionManager:
         self._device_status: Dict[str, DeviceStatus] = {}
         # Redis客户端
         self._redis_client = None
+        # 状态代数：设备连接、断开、信息更新、心跳时递增，用于云监视的条件查询
+        self._epoch = generate_uuid()[:8]  # 进程标识，服务重启后旧版本号失效
+        self._generation = 0
+        self._device_generation: Dict[str, int] = {}
+        # 已断开设备及断开时的代数（按断开顺序，超出上限淘汰最早的记录）
+        self._removed_generation: "OrderedDict[str, int]" = OrderedDict()
+        self._removed_floor = 0  # 已淘汰断开记录的最大代数，早于该代数的版本无法增量查询
+        # 离线设备的待下发命令
+        self._pending_commands = PendingCommandStore(
+            settings.pending_command_max_per_device,
+            settings.pending_command_max_bytes,
+        )
+        # 设备孪生：期望状态与上报状态不一致时下发控制命令
+        self._device_twin = DeviceTwinManager(self.send_message)
+        # 设备信息轮询：按设备状态变化自适应调整轮询间隔
+        self._device_poller = DeviceInfoPoller(self.send_message)
+        # 设备连接回调（调度器等子系统在设备上线时重试）
+        self._connect_listeners: List[Callable[[str], None]] = []
+        # 序列化快照缓存：设备ID -> (代数, JSON)，以及全量设备列表 (代数, JSON)
+        self._snapshot_cache: Dict[str, Tuple[int, bytes]] = {}
+        self._list_snapshot: Optional[Tuple[int, bytes]] = None
         
     # 连接redis缓存
     async def connect_redis(self):
         """连接 Redis"""
+        # 延迟导入：未启用 Redis 时不承担 redis.asyncio 的导入开销
+        import redis.asyncio as redis
         try:
             self._redis_client = redis.from_url(
                 settings.redis_url,
@@ -62,28 +90,34 @@ class ConnectionManager:
     async def _monitor_heartbeats(self):
         logger.info("心跳监控已启动")
 
+        last_check_ts = current_timestamp_s()
         while True:
-            await asyncio.sleep(60)  # 每分钟检查一次
-            now_ts = current_timestamp_s()
-            timeout_devices = []
-
-            for device_id in self._connections.keys():
-                request = DriftMessage(
-                    type=DriftMsgType.S2D_CONTROL,
-                    event=DriftEvent.DEVICE_INFO,
-                    deviceId=device_id,
-                    playId=device_id,
-                )
-                await self.send_message(device_id, request.model_dump())
-
-                time_diff = now_ts - self._device_status[device_id].last_heartbeat
-                if time_diff > settings.heartbeat_timeout:
-                    logger.warning(f"设备 {device_id} 心跳超时")
-                    timeout_devices.append(device_id)
+            await asyncio.sleep(settings.device_poll_tick)
+            try:
+                # 按设备自适应轮询设备信息
+                await self._device_poller.poll()
+
+                now_ts = current_timestamp_s()
+                if now_ts - last_check_ts < 60:  # 每分钟检查一次超时
+                    continue
+                last_check_ts = now_ts
+                timeout_devices = []
+
+                for device_id, device_status in self._device_status.items():
+                    time_diff = now_ts - device_status.last_heartbeat
+                    if time_diff > settings.heartbeat_timeout:
+                        logger.warning(f"设备 {device_id} 心跳超时")
+                        timeout_devices.append(device_id)
             
-            # 断开超时设备
-            for device_id in timeout_devices:
-                await self.disconnect(device_id, code=1008, reason="心跳超时")
+                # 断开超时设备
+                for device_id in timeout_devices:
+                    await self.disconnect(device_id, code=1008, reason="心跳超时")
+
+                # 清理过期的待下发命令
+                self._pending_commands.purge_expired()
+            except Exception as e:
+                # 单台设备的异常不能终止监控任务
+                logger.error(f"心跳监控异常: {e}")
     
     # 接受设备连接
     async def connect(
@@ -93,9 +127,15 @@ class ConnectionManager:
         device_sn: str,
         device_id: str,
         language: str
-        ) -> str:
+        ):
         """设备连接"""
         await websocket.accept()
+
+        # 同一设备重复连接：关闭旧连接，旧连接的状态随之清理
+        old_websocket = self._connections.get(device_id)
+        if old_websocket is not None:
+            logger.warning(f"设备 {device_id} 重复连接，关闭旧连接")
+            await self.disconnect(device_id, code=1000, reason="设备已在新连接上线", websocket=old_websocket)
         
         # 保存连接
         self._connections[device_id] = websocket
@@ -110,8 +150,27 @@ class ConnectionManager:
             device_id=device_id,
             device_info=device_info,
         )
+        self._removed_generation.pop(device_id, None)
+        self._bump_generation(device_id)
+        self._device_poller.on_connected(device_id)
+
+        for listener in self._connect_listeners:
+            try:
+                listener(device_id)
+            except Exception as e:
+                logger.error(f"设备连接回调出错: {e}")
         
+        if trafficRecorder.enabled:
+            trafficRecorder.record(FrameDirection.CONNECT, device_id, {
+                "room_id": room_id,
+                "device_sn": device_sn,
+                "language": language,
+            })
+
         logger.info(f"设备建立连接: {device_id}")
+
+        # 下发离线期间缓存的命令
+        await self._flush_pending_commands(device_id)
         
     
     # 断开设备连接
@@ -119,19 +178,23 @@ class ConnectionManager:
         self,
         device_id: str,
         code: int = 1000,
-        reason: str = "正常关闭"
+        reason: str = "正常关闭",
+        websocket: Optional[WebSocket] = None
         ):
-        """断开连接"""
-        if device_id in self._connections:
-            try:
-                websocket = self._connections[device_id]
-                # 检查连接状态
-                if websocket.client_state != WebSocketState.DISCONNECTED and websocket.application_state != WebSocketState.DISCONNECTED:
-                    await websocket.close(code=code, reason=reason)
-            except Exception as e:
-                logger.error(f"关闭连接时出错: {e}")
-            finally:
-                # 清理连接
+        """断开连接（指定 websocket 时只在其仍是设备当前连接时清理设备状态）"""
+        if websocket is None:
+            websocket = self._connections.get(device_id)
+            if websocket is None:
+                return
+        try:
+            # 检查连接状态
+            if websocket.client_state != WebSocketState.DISCONNECTED and websocket.application_state != WebSocketState.DISCONNECTED:
+                await websocket.close(code=code, reason=reason)
+        except Exception as e:
+            logger.error(f"关闭连接时出错: {e}")
+        finally:
+            # 清理连接（关闭期间设备可能已在新连接上线，此时不清理）
+            if self._connections.get(device_id) is websocket:
                 self._cleanup_connection(device_id)
 
     # 清理连接数据
@@ -142,33 +205,97 @@ class ConnectionManager:
         
         if device_id in self._device_status:
             del self._device_status[device_id]
+            self._remove_generation(device_id)
+            self._device_twin.on_disconnected(device_id)
+            self._device_poller.on_disconnected(device_id)
+
+        if trafficRecorder.enabled:
+            trafficRecorder.record(FrameDirection.DISCONNECT, device_id, {})
         
         logger.info(f"连接清理完成: {device_id}")
     
+    # 注册设备连接回调
+    def add_connect_listener(self, listener: Callable[[str], None]):
+        """注册设备建立连接时的回调（同步调用，不应阻塞）"""
+        self._connect_listeners.append(listener)
+
     # 心跳监控
     async def update_heartbeat(self, device_id: str):
         """更新心跳时间"""
         if device_id in self._device_status:
-            self._device_status[device_id].last_heartbeat = current_timestamp_s()
+            device_status = self._device_status[device_id]
+            now_ts = current_timestamp_s()
+            # 心跳时间（秒）变化时才使设备版本递增，同一秒内的重复上报仍可返回 304
+            if device_status.last_heartbeat != now_ts:
+                device_status.last_heartbeat = now_ts
+                self._bump_generation(device_id)
+            self._device_poller.on_alive(device_id)
         else:
             logger.error(f"更新心跳时间失败：设备连接 {device_id} 不存在")
     
     # 接收设备消息
-    async def receive_message(self, device_id: str):
-        """接收设备消息"""
+    async def receive_message(self, device_id: str, websocket: Optional[WebSocket] = None):
+        """接收设备消息（指定 websocket 时从该连接接收，否则从设备当前连接接收）"""
         message_data = None
-        if device_id in self._connections:
-            websocket = self._connections[device_id]
+        if websocket is None:
+            websocket = self._connections.get(device_id)
+        if websocket is not None:
             message_data = await websocket.receive_json()
-            logger.debug(f"收到消息: {json.dumps(message_data, indent=2, ensure_ascii=False)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"收到消息: {json.dumps(message_data, indent=2, ensure_ascii=False)}")
         return message_data
 
     # 发送消息到指定设备
-    async def send_message(self, device_id: str, message: dict):
-        logger.debug(f"发送消息: {json.dumps(message, indent=2, ensure_ascii=False)}")
-        if device_id in self._connections:
-            websocket = self._connections[device_id]
+    async def send_message(self, device_id: str, message: dict, websocket: Optional[WebSocket] = None) -> bool:
+        """发送消息（指定 websocket 时发送到该连接，用于回复该连接上的请求），设备未连接时返回 False"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"发送消息: {json.dumps(message, indent=2, ensure_ascii=False)}")
+        if websocket is None:
+            websocket = self._connections.get(device_id)
+        if websocket is not None:
+            if trafficRecorder.enabled:
+                trafficRecorder.record(FrameDirection.OUTBOUND, device_id, message)
             await websocket.send_json(message)
+            # 控制命令可能改变设备状态，尽快轮询设备信息
+            if message.get("type") == DriftMsgType.S2D_CONTROL and message.get("event") != DriftEvent.DEVICE_INFO:
+                self._device_poller.expedite(device_id)
+            return True
+        return False
+
+    # 发送命令，设备离线时缓存待上线后下发
+    async def send_or_queue(self, device_id: str, message: dict, ttl: Optional[int] = None) -> CommandDelivery:
+        """发送命令；设备离线或发送失败时缓存，返回命令的下发结果"""
+        try:
+            if await self.send_message(device_id, message):
+                return CommandDelivery.DELIVERED
+        except Exception as e:
+            logger.warning(f"发送命令到设备 {device_id} 失败，转为缓存: {e}")
+
+        if ttl is None:
+            ttl = settings.pending_command_ttl
+        if device_id and self._pending_commands.put(device_id, message, ttl):
+            logger.info(f"设备 {device_id} 离线，命令已缓存: {message.get('event')}")
+            return CommandDelivery.QUEUED
+        logger.warning(f"设备 {device_id} 离线，命令无法缓存: {message.get('event')}")
+        return CommandDelivery.DROPPED
+
+    # 下发缓存的命令
+    async def _flush_pending_commands(self, device_id: str):
+        commands = self._pending_commands.pop_device(device_id)
+        if not commands:
+            return
+        for index, command in enumerate(commands):
+            try:
+                await self.send_message(device_id, command.message)
+            except Exception as e:
+                # 发送失败：未发送的命令按原顺序放回，保留剩余有效期
+                logger.error(f"下发缓存命令到设备 {device_id} 失败: {e}")
+                now = time.time()
+                for remaining in commands[index:]:
+                    if remaining.expire_at > now:
+                        self._pending_commands.put(device_id, remaining.message, remaining.expire_at - now)
+                return
+        logger.info(f"设备 {device_id} 上线，已下发缓存命令 {len(commands)} 条")
     
     # 获取设备信息
     def get_device_status(self, device_id: str) -> Optional[DeviceStatus]:
@@ -176,8 +303,10 @@ class ConnectionManager:
         return self._device_status.get(device_id)
     
     # 检查设备是否已连接
-    def connected(self, device_id: str) -> bool:
-        """检查设备是否已连接"""
+    def connected(self, device_id: str, websocket: Optional[WebSocket] = None) -> bool:
+        """检查设备是否已连接（指定 websocket 时检查其是否为设备当前连接）"""
+        if websocket is not None:
+            return self._connections.get(device_id) is websocket
         return device_id in self._connections
     
     def get_device_list(self) -> List[DeviceStatus]:
@@ -189,9 +318,133 @@ class ConnectionManager:
         """更新设备信息"""
         if device_id in self._device_status:
             self._device_status[device_id].device_info = device_info
+            self._bump_generation(device_id)
+            self._device_twin.on_reported(device_id, device_info)
         else:
             logger.error(f"更新设备信息失败：设备连接 {device_id} 不存在")
 
 
+    # 记录设备信息上报
+    def record_device_report(self, device_id: str, data: dict) -> bool:
+        """记录设备信息上报并调整轮询间隔，返回上报是否与上次不同（相同时无需重新解析）"""
+        if self._device_poller.on_report(device_id, data):
+            return True
+        # 上报未变化，设备孪生仍需据此确认或重发（期望状态可能在上次上报之后才设置）
+        device_status = self._device_status.get(device_id)
+        if device_status and device_status.device_info:
+            self._device_twin.on_reported(device_id, device_status.device_info)
+        return False
+
+    # 设备状态可能已变化，尽快轮询设备信息
+    def request_device_info(self, device_id: str):
+        """在短暂延迟后请求设备上报信息"""
+        self._device_poller.expedite(device_id)
+
+    # 获取设备信息轮询统计
+    def get_poll_stats(self) -> Dict[str, int]:
+        """返回轮询发送、跳过、提前轮询次数以及上报去重次数"""
+        return self._device_poller.stats()
+
+    # 设置设备期望状态
+    def set_desired_state(self, device_id: str, desired: dict) -> DeviceTwinStatus:
+        """设置设备期望状态，只下发与上报状态不一致的字段"""
+        # 设备连接后已上报过设备信息时，直接以其为比较基准，无需再请求上报
+        reported_at = self._device_poller.get_last_report_at(device_id)
+        device_status = self._device_status.get(device_id)
+        if reported_at and device_status and device_status.device_info:
+            return self._device_twin.set_desired(
+                device_id, desired, device_status.device_info, int(reported_at)
+            )
+        return self._device_twin.set_desired(device_id, desired)
+
+    # 获取设备孪生状态
+    def get_twin_status(self, device_id: str) -> Optional[DeviceTwinStatus]:
+        """获取设备期望状态与收敛情况"""
+        return self._device_twin.get_status(device_id)
+
+    # 设备状态变更，递增代数
+    def _bump_generation(self, device_id: str):
+        self._generation += 1
+        self._device_generation[device_id] = self._generation
+
+    # 设备断开，记录断开代数
+    def _remove_generation(self, device_id: str):
+        self._generation += 1
+        self._device_generation.pop(device_id, None)
+        self._snapshot_cache.pop(device_id, None)
+        self._removed_generation[device_id] = self._generation
+        self._removed_generation.move_to_end(device_id)
+        while len(self._removed_generation) > settings.monitor_removed_history:
+            _, generation = self._removed_generation.popitem(last=False)
+            self._removed_floor = generation
+
+    # 当前全局代数
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    # 设备代数（设备不存在时为 0）
+    def get_device_generation(self, device_id: str) -> int:
+        return self._device_generation.get(device_id, 0)
+
+    # 版本号：进程标识 + 代数
+    def format_version(self, generation: int) -> str:
+        return f"{self._epoch}:{generation}"
+
+    # 解析版本号
+    def parse_version(self, version: Optional[str]) -> Optional[int]:
+        """解析客户端携带的版本号，非本进程生成或格式错误时返回 None"""
+        if not isinstance(version, str):
+            return None
+        epoch, _, generation = version.partition(":")
+        if epoch != self._epoch or not generation.isdigit():
+            return None
+        generation = int(generation)
+        return generation if generation <= self._generation else None
+
+    # 获取设备状态的序列化快照
+    def get_device_snapshot(self, device_id: str) -> Optional[bytes]:
+        """返回设备状态的 JSON，状态未变化时复用缓存"""
+        device_status = self._device_status.get(device_id)
+        if device_status is None:
+            return None
+        generation = self._device_generation.get(device_id, 0)
+        cached = self._snapshot_cache.get(device_id)
+        if cached and cached[0] == generation:
+            return cached[1]
+        snapshot = orjson.dumps(device_status.model_dump())
+        self._snapshot_cache[device_id] = (generation, snapshot)
+        return snapshot
+
+    # 获取全量设备列表的序列化快照
+    def get_device_list_snapshot(self) -> bytes:
+        """返回所有设备状态的 JSON 数组，全局代数未变化时复用缓存"""
+        if self._list_snapshot and self._list_snapshot[0] == self._generation:
+            return self._list_snapshot[1]
+        snapshot = b"[" + b",".join(
+            self.get_device_snapshot(device_id) for device_id in self._device_status
+        ) + b"]"
+        self._list_snapshot = (self._generation, snapshot)
+        return snapshot
+
+    # 获取指定代数之后的变更
+    def get_device_changes(self, since: int) -> Optional[Tuple[bytes, List[str]]]:
+        """返回 (变更设备状态 JSON 数组, 已断开设备ID列表)，断开记录已被淘汰而无法增量时返回 None"""
+        if since < self._removed_floor:
+            return None
+        changed = b"[" + b",".join(
+            self.get_device_snapshot(device_id)
+            for device_id, generation in self._device_generation.items()
+            if generation > since
+        ) + b"]"
+        # 断开记录按代数递增排列，从尾部向前取到 since 为止
+        removed = []
+        for device_id in reversed(self._removed_generation):
+            if self._removed_generation[device_id] <= since:
+                break
+            removed.append(device_id)
+        return changed, removed
+
+
 # 全局连接管理器
 connectionManager = ConnectionManager()
@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from jwt import JWT, AbstractJWKBase, jwk_from_dict
+from jwt.exceptions import JWTException
+from jwt.utils import b64decode
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class AuthError(Exception):
+    """设备认证失败"""
+    pass
+
+
+# 读取令牌头部中的 kid（不校验签名）
+def get_token_kid(token: str) -> str:
+    try:
+        header = json.loads(b64decode(token.split(".", 1)[0]))
+    except (ValueError, UnicodeDecodeError):
+        raise AuthError("令牌格式错误")
+    if not isinstance(header, dict):
+        raise AuthError("令牌格式错误")
+    return str(header.get("kid", ""))
+
+
+'''
+设备认证器：校验设备签名令牌（JWT）
+- 已校验的令牌缓存在 LRU 中（按令牌过期时间和缓存有效期淘汰），重连时无需再次验签
+- 公钥从 JWKS 文件加载并按 kid 缓存，文件变更后重新加载以支持密钥轮换
+- 验签在线程池中执行，不阻塞事件循环；同一令牌的并发校验只验签一次
+'''
+class DeviceAuthenticator:
+    # 构造函数
+    def __init__(self):
+        self._jwt = JWT()
+        # 已校验令牌：令牌摘要 -> (设备ID, 缓存过期时间, kid)
+        self._token_cache: "OrderedDict[bytes, Tuple[str, float, str]]" = OrderedDict()
+        # 公钥缓存：kid -> 公钥
+        self._keys: Dict[str, AbstractJWKBase] = {}
+        self._keys_mtime = 0.0
+        self._keys_checked_at = 0.0
+        # 正在验签的令牌：令牌摘要 -> 校验结果（设备ID, 缓存过期时间, kid）
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 统计
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.failures = 0
+
+    # 认证设备
+    async def authenticate(self, token: Optional[str], device_id: str) -> bool:
+        """校验令牌是否属于该设备"""
+        if not token:
+            self.failures += 1
+            return False
+
+        now = time.time()
+        self._refresh_keys(now)
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        cached = self._token_cache.get(digest)
+        if cached and cached[1] > now and cached[2] in self._keys:
+            self._token_cache.move_to_end(digest)
+            self.cache_hits += 1
+            if cached[0] == device_id:
+                return True
+            self.failures += 1
+            return False
+
+        self.cache_misses += 1
+        try:
+            subject, _, _ = await self._verify_shared(digest, token)
+        except AuthError as e:
+            logger.warning(f"设备 {device_id} 认证失败: {e}")
+            self.failures += 1
+            return False
+
+        if subject != device_id:
+            logger.warning(f"设备 {device_id} 认证失败: 令牌属于设备 {subject}")
+            self.failures += 1
+            return False
+        return True
+
+    # 关闭验签线程池
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # 同一令牌的并发校验共享一次验签
+    async def _verify_shared(self, digest: bytes, token: str) -> Tuple[str, float, str]:
+        future = self._inflight.get(digest)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[digest] = future
+        try:
+            result = await self._verify(token)
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._inflight[digest]
+            if not future.done():
+                # 首个调用者被取消：其余等待者按认证失败处理，避免永久等待
+                future.set_exception(AuthError("验签已取消"))
+                future.exception()
+
+        self._token_cache[digest] = result
+        self._token_cache.move_to_end(digest)
+        while len(self._token_cache) > settings.device_auth_cache_size:
+            self._token_cache.popitem(last=False)
+        return result
+
+    # 校验令牌签名与声明
+    async def _verify(self, token: str) -> Tuple[str, float, str]:
+        kid = get_token_kid(token)
+        key = self._get_key(kid)
+        if key is None:
+            raise AuthError(f"未知的密钥 kid={kid}")
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.device_auth_workers,
+                thread_name_prefix="device-auth",
+            )
+        loop = asyncio.get_running_loop()
+        try:
+            claims = await loop.run_in_executor(self._executor, self._decode, token, key)
+        except Exception as e:
+            raise AuthError(f"令牌校验失败: {e}")
+
+        subject = claims.get("sub")
+        if not subject:
+            raise AuthError("令牌缺少 sub")
+        expire_at = time.time() + settings.device_auth_cache_ttl
+        if "exp" in claims:
+            expire_at = min(expire_at, float(claims["exp"]))
+        return str(subject), expire_at, kid
+
+    def _decode(self, token: str, key: AbstractJWKBase) -> dict:
+        return self._jwt.decode(
+            token,
+            key,
+            algorithms=set(settings.device_auth_algorithms.split(",")),
+            do_time_check=True,
+        )
+
+    # 按 kid 获取公钥
+    def _get_key(self, kid: str) -> Optional[AbstractJWKBase]:
+        key = self._keys.get(kid)
+        if key is None:
+            # 未知 kid 可能是刚轮换的新密钥，立即检查密钥文件（限频）
+            self._refresh_keys(time.time(), force=True)
+            key = self._keys.get(kid)
+        return key
+
+    # 定期检查密钥文件
+    def _refresh_keys(self, now: float, force: bool = False):
+        interval = 1.0 if force else settings.device_auth_key_check_interval
+        if now - self._keys_checked_at >= interval:
+            self._keys_checked_at = now
+            self._reload_keys()
+
+    # JWKS 文件变更后重新加载公钥
+    def _reload_keys(self):
+        path = settings.device_auth_jwks_path
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            logger.error(f"读取设备认证密钥失败: {e}")
+            return
+        if mtime == self._keys_mtime:
+            return
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                jwks = json.load(f)
+            keys = {
+                str(jwk.get("kid", "")): jwk_from_dict(jwk)
+                for jwk in jwks.get("keys", [])
+            }
+        except (OSError, ValueError, JWTException) as e:
+            logger.error(f"加载设备认证密钥失败: {e}")
+            return
+
+        self._keys = keys
+        self._keys_mtime = mtime
+        # 已移除密钥签发的令牌不再视为有效
+        revoked = [digest for digest, entry in self._token_cache.items() if entry[2] not in keys]
+        for digest in revoked:
+            del self._token_cache[digest]
+        logger.info(f"设备认证密钥已加载: {len(keys)} 个，失效缓存令牌 {len(revoked)} 个")
+
+
+# 全局设备认证器
+deviceAuthenticator = DeviceAuthenticator()
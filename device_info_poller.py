@@ -0,0 +1,146 @@
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+from config import settings
+from models import DriftEvent, DriftMessage, DriftMsgType
+
+
+logger = logging.getLogger(__name__)
+
+
+'''
+单台设备的轮询状态
+'''
+class DevicePollState:
+    __slots__ = (
+        "last_report", "last_report_at", "last_alive_at",
+        "interval", "next_check_at", "expedite_at",
+    )
+
+    # 构造函数
+    def __init__(self, now: float):
+        # 最近一次上报的原始数据（连接后尚未上报时为 None）
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.last_report_at = 0.0
+        # 最近一次收到心跳或上报的时间
+        self.last_alive_at = now
+        # 当前轮询间隔：上报不变时加倍，变化时恢复最小间隔
+        self.interval = float(settings.device_poll_min_interval)
+        # 下一次按固定周期检查是否需要轮询的时间（连接后尽快获取一次设备信息）
+        self.next_check_at = now
+        # 下发控制命令或设备报告失败后，提前轮询的时间
+        self.expedite_at: Optional[float] = None
+
+
+'''
+设备信息轮询器：按设备自适应地请求设备上报 device_info
+- 上报内容不变的设备逐步退避轮询间隔，内容变化后恢复最小间隔
+- 下发控制命令或设备报告命令失败后尽快轮询
+- 最近有心跳或上报的设备无需为探活而轮询
+- 与上次完全相同的上报不再重复解析
+'''
+class DeviceInfoPoller:
+    # 构造函数
+    def __init__(self, send: Callable[[str, dict], Awaitable[bool]]):
+        self._send = send
+        # 设备ID -> 轮询状态
+        self._states: Dict[str, DevicePollState] = {}
+        # 统计（以固定周期逐台轮询为基准）
+        self.polls_sent = 0
+        self.polls_skipped = 0
+        self.polls_expedited = 0
+        self.reports_changed = 0
+        self.reports_deduplicated = 0
+
+    # 设备连接
+    def on_connected(self, device_id: str):
+        self._states[device_id] = DevicePollState(time.time())
+
+    # 设备断开
+    def on_disconnected(self, device_id: str):
+        self._states.pop(device_id, None)
+
+    # 收到设备心跳或其他通知
+    def on_alive(self, device_id: str):
+        state = self._states.get(device_id)
+        if state:
+            state.last_alive_at = time.time()
+
+    # 收到设备信息上报
+    def on_report(self, device_id: str, data: Dict[str, Any]) -> bool:
+        """记录上报并调整轮询间隔，与上次上报相同时返回 False"""
+        state = self._states.get(device_id)
+        if state is None:
+            return True
+        now = time.time()
+        state.last_alive_at = now
+        state.last_report_at = now
+        if state.last_report == data:
+            state.interval = min(state.interval * 2, settings.device_poll_max_interval)
+            self.reports_deduplicated += 1
+            return False
+        state.last_report = data
+        state.interval = float(settings.device_poll_min_interval)
+        self.reports_changed += 1
+        return True
+
+    # 设备连接后最近一次上报的时间（尚未上报时为 0）
+    def get_last_report_at(self, device_id: str) -> float:
+        state = self._states.get(device_id)
+        if state is None or state.last_report is None:
+            return 0.0
+        return state.last_report_at
+
+    # 提前轮询（设备状态可能已变化）
+    def expedite(self, device_id: str):
+        state = self._states.get(device_id)
+        if state is None:
+            return
+        expedite_at = time.time() + settings.device_poll_after_command
+        if state.expedite_at is None or expedite_at < state.expedite_at:
+            state.expedite_at = expedite_at
+
+    # 向到期的设备发送轮询请求
+    async def poll(self):
+        now = time.time()
+        due = []
+        for device_id, state in self._states.items():
+            if state.expedite_at is not None and now >= state.expedite_at:
+                state.expedite_at = None
+                state.next_check_at = now + settings.device_poll_min_interval
+                self.polls_expedited += 1
+                due.append(device_id)
+                continue
+            if now < state.next_check_at:
+                continue
+            state.next_check_at = now + settings.device_poll_min_interval
+            if (now - state.last_alive_at >= settings.device_poll_alive_window
+                    or now - state.last_report_at >= state.interval):
+                due.append(device_id)
+            else:
+                self.polls_skipped += 1  # 设备在线且状态未到刷新时间
+
+        # 先收集再发送：发送期间设备可能连接或断开
+        for device_id in due:
+            try:
+                request = DriftMessage(
+                    type=DriftMsgType.S2D_CONTROL,
+                    event=DriftEvent.DEVICE_INFO,
+                    deviceId=device_id,
+                    playId=device_id,
+                )
+                if await self._send(device_id, request.model_dump()):
+                    self.polls_sent += 1
+            except Exception as e:
+                logger.warning(f"请求设备 {device_id} 上报信息失败: {e}")
+
+    # 轮询统计
+    def stats(self) -> Dict[str, int]:
+        return {
+            "devices": len(self._states),
+            "polls_sent": self.polls_sent,
+            "polls_skipped": self.polls_skipped,
+            "polls_expedited": self.polls_expedited,
+            "reports_changed": self.reports_changed,
+            "reports_deduplicated": self.reports_deduplicated,
+        }
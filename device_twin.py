@@ -0,0 +1,265 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from config import settings
+from models import (
+    DeviceInfo, DeviceTwinStatus, DriftEvent, DriftMessage, DriftMsgType
+)
+
+
+logger = logging.getLogger(__name__)
+
+# 数值类字段 -> 控制事件
+TWIN_VALUE_EVENTS = {
+    "dzoom": DriftEvent.DZOOM,
+    "stream_res": DriftEvent.STREAM_RES,
+    "stream_bitrate": DriftEvent.STREAM_BITRATE,
+    "stream_framerate": DriftEvent.STREAM_FRAMERATE,
+    "led": DriftEvent.LED,
+    "exposure": DriftEvent.EXPOSURE,
+    "filter": DriftEvent.FILTER,
+    "mic_sensitivity": DriftEvent.MIC_SENSITIVITY,
+    "fov": DriftEvent.FOV,
+}
+
+# 开关类字段（start/stop） -> (开始事件, 停止事件)
+TWIN_SWITCH_EVENTS = {
+    "record": (DriftEvent.START_RECORD, DriftEvent.STOP_RECORD),
+    "rtmp": (DriftEvent.START_RTMP, DriftEvent.STOP_RTMP),
+    "rtsp": (DriftEvent.START_RTSP, DriftEvent.STOP_RTSP),
+}
+
+TWIN_FIELDS = set(TWIN_VALUE_EVENTS) | set(TWIN_SWITCH_EVENTS)
+
+
+'''
+单台设备的孪生状态
+'''
+class DeviceTwin:
+    # 构造函数
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        # 期望状态
+        self.desired: Dict[str, Any] = {}
+        # 最近一次上报的设备信息（连接后尚未上报时为 None）
+        self.reported: Optional[Dict[str, Any]] = None
+        self.reported_at = 0
+        # 已下发、等待上报确认的字段：字段 -> (值, 下发时间)
+        self.in_flight: Dict[str, Tuple[Any, float]] = {}
+        # 字段下发次数，超过上限后放弃
+        self.attempts: Dict[str, int] = {}
+        self.failed: Set[str] = set()
+        # 最近一次请求设备上报的时间
+        self.report_requested_at = 0.0
+        # 合并窗口或重发检查定时器
+        self.reconcile_handle: Optional[asyncio.TimerHandle] = None
+        # 统计
+        self.commands_sent = 0
+        self.commands_skipped = 0
+
+    # 期望与上报不一致的字段
+    def diff(self) -> Dict[str, Any]:
+        if self.reported is None:
+            return dict(self.desired)
+        return {
+            field: value for field, value in self.desired.items()
+            if self.reported.get(field) != value
+        }
+
+    # 设备孪生状态
+    def status(self) -> DeviceTwinStatus:
+        pending = self.diff()
+        return DeviceTwinStatus(
+            device_id=self.device_id,
+            desired=self.desired,
+            reported={field: self.reported.get(field) for field in self.desired} if self.reported else {},
+            reported_at=self.reported_at,
+            pending=pending,
+            in_flight=sorted(self.in_flight),
+            failed=sorted(self.failed),
+            converged=self.reported is not None and not pending,
+            commands_sent=self.commands_sent,
+            commands_skipped=self.commands_skipped,
+        )
+
+
+'''
+设备孪生管理器：调用方设置期望状态，与设备上报的状态比较后只下发不一致字段对应的控制命令
+'''
+class DeviceTwinManager:
+    # 构造函数
+    def __init__(self, send: Callable[[str, dict], Awaitable[bool]]):
+        self._send = send
+        # 设备ID -> 孪生状态（按最近更新排序，超出上限淘汰最久未更新的设备）
+        self._twins: "OrderedDict[str, DeviceTwin]" = OrderedDict()
+        # 进行中的比较任务（保持引用，避免任务被回收）
+        self._tasks: Set[asyncio.Task] = set()
+
+    # 设置期望状态
+    def set_desired(
+        self,
+        device_id: str,
+        desired: Dict[str, Any],
+        reported: Optional[DeviceInfo] = None,
+        reported_at: int = 0,
+        ) -> DeviceTwinStatus:
+        """合并期望状态并在合并窗口结束后下发差异，返回当前孪生状态
+
+        reported 为设备连接后已上报的设备信息，孪生尚无上报状态时以此为比较基准
+        """
+        unknown = set(desired) - TWIN_FIELDS
+        if unknown:
+            raise ValueError(f"不支持的期望字段: {', '.join(sorted(unknown))}")
+        # 借助 DeviceInfo 校验并转换字段类型
+        validated = DeviceInfo(**desired)
+        for field in TWIN_SWITCH_EVENTS:
+            if field in desired and getattr(validated, field) not in ("start", "stop"):
+                raise ValueError(f"{field} 的期望值必须为 start 或 stop")
+
+        twin = self._twins.get(device_id)
+        if twin is None:
+            twin = self._twins[device_id] = DeviceTwin(device_id)
+            while len(self._twins) > settings.twin_max_devices:
+                _, evicted = self._twins.popitem(last=False)
+                if evicted.reconcile_handle:
+                    evicted.reconcile_handle.cancel()
+        self._twins.move_to_end(device_id)
+        if twin.reported is None and reported is not None:
+            twin.reported = reported.model_dump()
+            twin.reported_at = reported_at
+
+        for field in desired:
+            value = getattr(validated, field)
+            if twin.desired.get(field) != value:
+                twin.desired[field] = value
+                twin.in_flight.pop(field, None)
+                twin.attempts.pop(field, None)
+                twin.failed.discard(field)
+            if twin.reported is not None and twin.reported.get(field) == value:
+                twin.commands_skipped += 1  # 设备已是期望值，省去一次下发
+        self._schedule(twin)
+        return twin.status()
+
+    # 设备上报设备信息
+    def on_reported(self, device_id: str, device_info: DeviceInfo):
+        twin = self._twins.get(device_id)
+        if twin is None:
+            return
+        twin.reported = device_info.model_dump()
+        twin.reported_at = int(time.time())
+        # 已确认的字段不再等待
+        for field in list(twin.in_flight):
+            if twin.reported.get(field) == twin.desired.get(field):
+                del twin.in_flight[field]
+                twin.attempts.pop(field, None)
+        for field in list(twin.failed):
+            if twin.reported.get(field) == twin.desired.get(field):
+                twin.failed.discard(field)
+                twin.attempts.pop(field, None)
+        if twin.diff():
+            self._schedule(twin)
+
+    # 设备断开：上报状态失效，重新连接并上报后再比较
+    def on_disconnected(self, device_id: str):
+        twin = self._twins.get(device_id)
+        if twin is None:
+            return
+        twin.reported = None
+        twin.report_requested_at = 0.0
+        twin.in_flight.clear()
+        if twin.reconcile_handle:
+            twin.reconcile_handle.cancel()
+            twin.reconcile_handle = None
+
+    # 查询孪生状态
+    def get_status(self, device_id: str) -> Optional[DeviceTwinStatus]:
+        twin = self._twins.get(device_id)
+        return twin.status() if twin else None
+
+    # 在合并窗口结束（或指定延迟）后比较并下发（窗口内的多次更新只触发一次）
+    def _schedule(self, twin: DeviceTwin, delay: Optional[float] = None):
+        if delay is None:
+            delay = settings.twin_coalesce_window
+        loop = asyncio.get_running_loop()
+        if twin.reconcile_handle is not None:
+            if twin.reconcile_handle.when() <= loop.time() + delay:
+                return  # 已有更早的比较
+            twin.reconcile_handle.cancel()
+        twin.reconcile_handle = loop.call_later(delay, self._start_reconcile, twin)
+
+    def _start_reconcile(self, twin: DeviceTwin):
+        task = asyncio.create_task(self._reconcile(twin))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # 比较期望与上报状态，下发不一致的字段
+    async def _reconcile(self, twin: DeviceTwin):
+        twin.reconcile_handle = None
+        now = time.time()
+        if twin.reported is None:
+            # 连接后尚未上报：请求设备上报，收到上报后再比较
+            if now - twin.report_requested_at >= settings.twin_resend_interval:
+                try:
+                    request = DriftMessage(
+                        type=DriftMsgType.S2D_CONTROL,
+                        event=DriftEvent.DEVICE_INFO,
+                        deviceId=twin.device_id,
+                        playId=twin.device_id,
+                    )
+                    if await self._send(twin.device_id, request.model_dump()):
+                        twin.report_requested_at = now
+                except Exception as e:
+                    logger.error(f"请求设备 {twin.device_id} 上报信息失败: {e}")
+            return
+
+        resend_in: Optional[float] = None
+        for field, value in twin.diff().items():
+            if field in twin.failed:
+                continue
+            in_flight = twin.in_flight.get(field)
+            if in_flight and in_flight[0] == value and now - in_flight[1] < settings.twin_resend_interval:
+                # 已下发，等待设备确认
+                remaining = in_flight[1] + settings.twin_resend_interval - now
+                resend_in = remaining if resend_in is None else min(resend_in, remaining)
+                continue
+            if twin.attempts.get(field, 0) >= settings.twin_max_attempts:
+                logger.warning(f"设备 {twin.device_id} 的 {field} 多次下发未生效，放弃")
+                twin.failed.add(field)
+                continue
+
+            try:
+                message = self._build_command(twin.device_id, field, value)
+                sent = await self._send(twin.device_id, message)
+            except Exception as e:
+                logger.error(f"下发孪生命令到设备 {twin.device_id} 失败: {e}")
+                return
+            if not sent:
+                return  # 设备已离线，重新连接并上报后再比较
+            twin.in_flight[field] = (value, now)
+            twin.attempts[field] = twin.attempts.get(field, 0) + 1
+            twin.commands_sent += 1
+            resend_in = settings.twin_resend_interval if resend_in is None else min(resend_in, settings.twin_resend_interval)
+
+        # 已下发未确认的字段：到重发时间再检查，不依赖设备下一次上报
+        if resend_in is not None:
+            self._schedule(twin, resend_in)
+
+    # 构造字段对应的控制命令
+    def _build_command(self, device_id: str, field: str, value: Any) -> dict:
+        if field in TWIN_SWITCH_EVENTS:
+            start_event, stop_event = TWIN_SWITCH_EVENTS[field]
+            event = start_event if value == "start" else stop_event
+            data = {}
+        else:
+            event = TWIN_VALUE_EVENTS[field]
+            data = {field: value}
+        message = DriftMessage(
+            type=DriftMsgType.S2D_CONTROL,
+            event=event,
+            deviceId=device_id,
+            playId=device_id,
+            data=data,
+        )
+        return message.model_dump()
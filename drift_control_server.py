@@ -2,25 +2,45 @@ import json
 import logging
 from datetime import datetime
 from typing import Optional
-from fastapi import HTTPException, APIRouter
-from fastapi.responses import JSONResponse
+from fastapi import HTTPException, APIRouter, Query
+from fastapi.responses import ORJSONResponse
 from config import settings
-from models import DriftMessage, DriftMessage
+from models import DriftMessage, DriftMessage, DeviceTwinRequest
 from connection_manager import connectionManager
 
 
 logger = logging.getLogger(__name__)
 
-drift_cloudctrl_router = APIRouter()
+drift_cloudctrl_router = APIRouter(default_response_class=ORJSONResponse)
 
 # 设备云控API
+# 设备离线时命令被缓存（ttl 为缓存有效期，秒），响应中的 delivery 表示已发送、已缓存或被丢弃
 @drift_cloudctrl_router.post("/cloud-control")
-async def drift_cloud_control_handler(request: dict):
+async def drift_cloud_control_handler(request: dict, ttl: Optional[int] = Query(None, gt=0)):
     try:
         msg = DriftMessage(**request)
-        await connectionManager.send_message(msg.deviceId, request)
-        return msg.model_dump()
+        delivery = await connectionManager.send_or_queue(msg.deviceId, request, ttl)
+        return {**msg.model_dump(), "delivery": delivery}
         
     except Exception as e:
         logger.error(f"发送控制命令失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+# 设置设备期望状态（设备孪生），只下发与设备上报不一致的字段
+@drift_cloudctrl_router.post("/cloud-control/twin")
+async def drift_twin_desired_handler(request: DeviceTwinRequest):
+    try:
+        return connectionManager.set_desired_state(request.device_id, request.desired).model_dump()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"设置设备期望状态失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 查询设备孪生状态
+@drift_cloudctrl_router.get("/cloud-control/twin/{device_id}")
+async def drift_twin_status_handler(device_id: str):
+    status = connectionManager.get_twin_status(device_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"设备 {device_id} 没有期望状态")
+    return status.model_dump()
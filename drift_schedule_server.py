@@ -0,0 +1,42 @@
+import logging
+from fastapi import HTTPException, APIRouter
+from fastapi.responses import ORJSONResponse
+from models import ScheduleJobRequest
+from command_scheduler import commandScheduler
+
+
+logger = logging.getLogger(__name__)
+
+drift_schedule_router = APIRouter(default_response_class=ORJSONResponse)
+
+# 提交定时批量控制任务
+@drift_schedule_router.post("/cloud-control/schedule")
+async def drift_schedule_submit_handler(request: ScheduleJobRequest):
+    try:
+        return commandScheduler.submit(request).model_dump()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"提交定时任务失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 查询所有任务进度
+@drift_schedule_router.get("/cloud-control/schedule")
+async def drift_schedule_list_handler():
+    return [status.model_dump() for status in commandScheduler.list_status()]
+
+# 查询任务进度
+@drift_schedule_router.get("/cloud-control/schedule/{job_id}")
+async def drift_schedule_status_handler(job_id: str):
+    status = commandScheduler.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+    return status.model_dump()
+
+# 取消任务
+@drift_schedule_router.delete("/cloud-control/schedule/{job_id}")
+async def drift_schedule_cancel_handler(job_id: str):
+    status = commandScheduler.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"任务 {job_id} 不存在")
+    return status.model_dump()
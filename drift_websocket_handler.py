@@ -1,5 +1,6 @@
 import logging
 from typing import Optional
+from fastapi import WebSocket
 from models import (
     DriftMessage, DriftMessage, DriftEvent, DriftMsgType, DeviceInfo
 )
@@ -13,8 +14,9 @@ logger = logging.getLogger(__name__)
 async def handle_device_message(
     message_data: dict,
     device_id: str,
+    websocket: Optional[WebSocket] = None,
     ) -> Optional[dict]:
-    """处理设备消息"""
+    """处理设备消息（websocket 为收到消息的连接）"""
     try:
         # 验证消息格式
         message = DriftMessage(**message_data)
@@ -23,7 +25,7 @@ async def handle_device_message(
         if message.type == DriftMsgType.D2S_NOTIFY:
             return await handle_notify_message(message, device_id)
         elif message.type == DriftMsgType.D2S_DEVICE_CONTROL:
-            return await handle_device_control(message, device_id)
+            return await handle_device_control(message, device_id, websocket)
         else:
             logger.warning(f"不支持的消息类型: {message.type}")
             err_msg = DriftMessage(
@@ -37,14 +39,16 @@ async def handle_device_message(
             
     except Exception as e:
         logger.error(f"处理消息时出错: {e}")
-        err_msg = DriftMessage(
-                type=DriftMsgType.S2D_MESSAGE,
-                event=message.event,
-                deviceId=message.deviceId,
-                playId=message.playId,
-                code=-1,
-            )
-        return err_msg.model_dump()
+        # 消息可能未通过校验，按原始数据回复错误
+        raw = message_data if isinstance(message_data, dict) else {}
+        return {
+            "type": DriftMsgType.S2D_MESSAGE.value,
+            "event": raw.get("event", ""),
+            "deviceId": raw.get("deviceId", ""),
+            "playId": raw.get("playId", ""),
+            "data": {},
+            "code": -1,
+        }
 
 
 # 处理 notify 类型消息
@@ -69,6 +73,8 @@ async def handle_notify_message(
         if message.code:
             message = f"设备 {device_id} 处理 {message.event} 指令失败，错误码: {message.code}"
             logger.warning(message)
+            # 指令失败时设备状态可能与预期不符，尽快请求设备上报
+            connectionManager.request_device_info(device_id)
         else:
             message = f"设备 {device_id} 处理 {message.event} 指令成功"
             logger.info(message)
@@ -78,6 +84,7 @@ async def handle_notify_message(
 async def handle_device_control(
     message: DriftMessage,
     device_id: str,
+    websocket: Optional[WebSocket] = None,
     ) -> Optional[dict]:
     if message.event == DriftEvent.GET_RTMP:
         # 获取 RTMP 地址
@@ -92,7 +99,7 @@ async def handle_device_control(
     elif message.event == DriftEvent.POWER_OFF:
         # 关机请求
         return await handle_power_off(
-            message, device_id
+            message, device_id, websocket
         )
     else:
         logger.warning(f"未知的 device_control 事件: {message.event}")
@@ -112,6 +119,11 @@ async def handle_device_info(
     ) -> dict:
     """处理设备信息上报"""
     try:
+        # 记录上报；与上次上报完全相同时无需重新解析
+        changed = connectionManager.record_device_report(device_id, message.data)
+        if not changed:
+            logger.debug(f"设备信息未变化: {device_id}")
+            return None
         # 解析设备信息
         device_info = DeviceInfo(**message.data)
         # 更新管理器中的设备信息
@@ -201,20 +213,21 @@ async def get_screen_address(
 # 处理关机请求
 async def handle_power_off(
     message: DriftMessage,
-    device_id: str
-    ) -> dict:
+    device_id: str,
+    websocket: Optional[WebSocket] = None,
+    ) -> Optional[dict]:
     try:
         logger.info(f"设备请求关机: {device_id}")
-        # 关闭设备连接
-        connectionManager.disconnect(device_id)
-        
         ret_msg = DriftMessage(
             type=DriftMsgType.S2D_DEVICE_NOTIFY,
             event=message.event,
             deviceId=message.deviceId,
             playId=message.playId,
         )
-        return ret_msg.model_dump()
+        # 先回复关机确认，再关闭请求关机的连接
+        await connectionManager.send_message(device_id, ret_msg.model_dump(), websocket)
+        await connectionManager.disconnect(device_id, websocket=websocket)
+        return None
     except Exception as e:
         logger.error(f"处理关机请求时出错: {e}")
         err_msg = DriftMessage(
@@ -8,8 +8,10 @@ from fastapi import (
     BackgroundTasks,
     WebSocketException,
     )
+from config import settings
 from connection_manager import connectionManager
 from drift_websocket_handler import handle_device_message
+from traffic_recorder import trafficRecorder, FrameDirection
 
 
 logger = logging.getLogger(__name__)
@@ -29,33 +31,50 @@ async def drift_websocket(
     ):
     """Drift 设备 WebSocket 连接端点"""
 
-    # TODO：设备认证
+    # 设备认证：令牌通过 Authorization: Bearer 头或 token 查询参数传递
+    if settings.device_auth_enabled:
+        # 延迟导入：未启用认证时不承担 jwt/cryptography 的导入开销
+        from device_auth import deviceAuthenticator
+        token = websocket.query_params.get("token")
+        authorization = websocket.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:].strip()
+        if not await deviceAuthenticator.authenticate(token, device_id):
+            await websocket.close(code=1008, reason="设备认证失败")
+            return
 
     # 建立连接
     await connectionManager.connect(websocket, room_id, device_sn, device_id, language)
     # 接收并处理连接中的消息
-    await handle_connection_message(device_id)
+    await handle_connection_message(device_id, websocket)
 
 # 处理单个设备连接发送的消息
 async def handle_connection_message(
     device_id: str,
+    websocket: WebSocket,
     ):
-    """处理设备连接"""
+    """处理设备连接（设备在新连接上线后，旧连接的处理循环退出）"""
     try:
         while True:
-            if not connectionManager.connected(device_id):
+            if not connectionManager.connected(device_id, websocket):
                 break
             # 接收消息
-            message_data = await connectionManager.receive_message(device_id)
+            message_data = await connectionManager.receive_message(device_id, websocket)
+            if trafficRecorder.enabled:
+                trafficRecorder.record(FrameDirection.INBOUND, device_id, message_data)
             # 处理消息
-            response = await handle_device_message(message_data, device_id)
-            # 发送响应
+            response = await handle_device_message(message_data, device_id, websocket)
+            # 发送响应（回复到收到请求的连接，设备可能已在新连接上线）
             if response:
-                await connectionManager.send_message(device_id, response)
+                await connectionManager.send_message(device_id, response, websocket)
+    except WebSocketDisconnect as e:
+        logger.info(f"设备断开连接: {device_id}, code={e.code}")
+        await connectionManager.disconnect(device_id, websocket=websocket)
     except Exception as e:
         logger.error(f"处理 WebSocket 时出错: {e}")
         await connectionManager.disconnect(
             device_id,
             code=1011,
-            reason=f"{e}"
+            reason=f"{e}",
+            websocket=websocket
         )
@@ -1,3 +1,6 @@
+import time
+_startup_begin = time.perf_counter()  # 尽早记录，用于统计启动耗时
+
 import logging
 from typing import AsyncGenerator
 
@@ -5,14 +8,18 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from config import settings
 from connection_manager import connectionManager
+from traffic_recorder import trafficRecorder
+from command_scheduler import commandScheduler
 from drift_websocket_server import drift_websocket_router
 from drift_control_server import drift_cloudctrl_router
+from drift_schedule_server import drift_schedule_router
 from cloud_monitor_server import cloud_monitor_router
-import uvicorn
+
+_import_elapsed = time.perf_counter() - _startup_begin
 
 
 # 配置日志
-log_level=logging.DEBUG if settings.debug else logging.WARNING
+log_level=logging.DEBUG if settings.debug and not settings.production else logging.WARNING
 
 logging.basicConfig(
     level=log_level,
@@ -31,9 +38,24 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # 连接redis缓存
     # connectionManager.connect_redis()
 
+    # 启动流量记录
+    if settings.traffic_record_path:
+        await trafficRecorder.start(
+            settings.traffic_record_path,
+            settings.traffic_record_flush_interval,
+            settings.traffic_record_max_buffer,
+        )
+
     heartbeat_monitor_task = await connectionManager.start_heartbeat_monitor()
 
-    logger.info("应用启动完成")
+    # 启动定时批量控制调度器
+    await commandScheduler.start()
+
+    startup_elapsed = time.perf_counter() - _startup_begin
+    logger.info(
+        f"应用启动完成: 模块导入 {_import_elapsed * 1000:.1f} ms, "
+        f"启动总耗时 {startup_elapsed * 1000:.1f} ms（导入明细见 startup_report.py）"
+    )
     
     yield  # 应用运行中
     
@@ -42,6 +64,14 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
 
     if heartbeat_monitor_task:
         heartbeat_monitor_task.cancel()
+
+    await commandScheduler.stop()
+    if settings.device_auth_enabled:
+        from device_auth import deviceAuthenticator
+        deviceAuthenticator.close()
+
+    # 写出剩余流量记录
+    await trafficRecorder.stop()
     
     # 关闭所有 WebSocket 连接
     #for device_id in list(manager.active_connections.keys()):
@@ -71,6 +101,7 @@ app.add_middleware(
 # 注册路由
 app.include_router(drift_websocket_router, prefix=settings.drift_wss_prefix, tags=["Drift WebSocket Server"])
 app.include_router(drift_cloudctrl_router, prefix=settings.drift_api_prefix, tags=["Drift Cloud Control"])
+app.include_router(drift_schedule_router, prefix=settings.drift_api_prefix, tags=["Drift Cloud Control Schedule"])
 app.include_router(cloud_monitor_router, prefix=settings.drift_api_prefix, tags=["Drift Cloud Monitor"])
 
 # 处理根路径请求
@@ -81,13 +112,30 @@ async def root():
 
 # 启动应用
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host=settings.host,
-        port=settings.port,
-        reload=settings.debug,
-        reload_dirs=["."],
-        ws_ping_interval=settings.websocket_ping_interval,
-        ws_ping_timeout=settings.websocket_ping_timeout,
-        log_level=log_level
-    )
+    # uvicorn 仅在直接启动时需要，延迟导入
+    import uvicorn
+
+    if settings.production:
+        # 生产模式：uvloop 事件循环（已安装时自动选用，Windows 下为 asyncio）+ httptools HTTP 解析，关闭热重载和访问日志
+        uvicorn.run(
+            "main:app",
+            host=settings.host,
+            port=settings.port,
+            loop="auto",
+            http="httptools",
+            access_log=False,
+            ws_ping_interval=settings.websocket_ping_interval,
+            ws_ping_timeout=settings.websocket_ping_timeout,
+            log_level=log_level
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host=settings.host,
+            port=settings.port,
+            reload=settings.debug,
+            reload_dirs=["."],
+            ws_ping_interval=settings.websocket_ping_interval,
+            ws_ping_timeout=settings.websocket_ping_timeout,
+            log_level=log_level
+        )
@@ -1,6 +1,5 @@
-from urllib import request
 from pydantic import BaseModel, Field, field_validator
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from enum import Enum
 from utils import current_timestamp_s
 
@@ -41,6 +40,12 @@ class DriftEvent(str, Enum):
     FOV = "fov"
     SCREEN = "screen"
 
+class CommandDelivery(str, Enum):
+    """云控命令下发结果枚举"""
+    DELIVERED = "delivered"  # 已发送到设备
+    QUEUED = "queued"        # 设备离线，已缓存，上线后下发
+    DROPPED = "dropped"      # 设备离线且无法缓存
+
 class Resolution(str, Enum):
     """分辨率枚举"""
     RES_4K = "4K"
@@ -88,8 +93,8 @@ class DeviceStatus(BaseModel):
     """设备状态模型"""
     device_id: str = Field("", description="设备ID")
     device_info: Optional[DeviceInfo] = None  # 设备信息
-    connection_time: int = Field(current_timestamp_s(), description="连接时间")
-    last_heartbeat: int = Field(current_timestamp_s(), description="最后心跳时间")
+    connection_time: int = Field(default_factory=current_timestamp_s, description="连接时间")
+    last_heartbeat: int = Field(default_factory=current_timestamp_s, description="最后心跳时间")
 
 '''
 class DeviceJoinMessage(DriftRequest):
@@ -123,12 +128,33 @@ class ControlMessage(DriftRequest):
     type: MessageType = MessageType.S2D_CONTROL
 '''
 
+# ================================== 设备孪生 ==================================
+
+class DeviceTwinRequest(BaseModel):
+    """设置设备期望状态请求"""
+    device_id: str = Field(..., description="设备ID")
+    desired: Dict[str, Any] = Field(..., description="期望的设备信息字段（DeviceInfo 字段的子集）")
+
+class DeviceTwinStatus(BaseModel):
+    """设备孪生状态"""
+    device_id: str = Field("", description="设备ID")
+    desired: Dict[str, Any] = Field({}, description="期望状态")
+    reported: Dict[str, Any] = Field({}, description="期望字段对应的上报值")
+    reported_at: int = Field(0, description="最近上报时间")
+    pending: Dict[str, Any] = Field({}, description="尚未生效的字段")
+    in_flight: List[str] = Field([], description="已下发、等待确认的字段")
+    failed: List[str] = Field([], description="多次下发未生效的字段")
+    commands_sent: int = Field(0, description="已下发的控制命令数")
+    commands_skipped: int = Field(0, description="设备已是期望值而省去的下发数")
+    converged: bool = Field(False, description="上报状态是否已与期望一致")
+
 # ================================== 云监视 ==================================
 
 class MonitorMsgType(str, Enum):
     """云监视消息类型枚举"""
     GET_DEVICE_LIST = "get_device_list"  # 获取设备列表
     GET_DEVICE_STATUS = "get_device_status"  # 获取设备状态
+    GET_POLL_STATS = "get_poll_stats"  # 获取设备信息轮询统计
 
 class MonitorRequest(BaseModel):
     """云监视请求消息"""
@@ -141,4 +167,37 @@ class MonitorResponse(BaseModel):
     info: str = Field("ok", description="状态信息")
     type: str = Field("", description="消息类型")
     data: Optional[Dict[str, Any]] = Field({}, description="数据")
-    
\ No newline at end of file
+
+# ================================== 定时批量控制 ==================================
+
+class ScheduleJobState(str, Enum):
+    """定时任务状态枚举"""
+    SCHEDULED = "scheduled"  # 等待开始
+    RUNNING = "running"      # 正在下发
+    WAITING = "waiting"      # 已下发在线设备，等待离线设备上线重试
+    COMPLETED = "completed"  # 已完成
+    CANCELLED = "cancelled"  # 已取消
+
+class ScheduleJobRequest(BaseModel):
+    """定时批量控制请求"""
+    message: DriftMessage = Field(..., description="控制消息模板（deviceId 由调度器填充）")
+    device_ids: List[str] = Field([], description="目标设备ID列表")
+    all_devices: bool = Field(False, description="是否下发给开始时所有在线设备")
+    start_at: int = Field(0, ge=0, description="开始时间（Unix 秒），0 表示立即开始")
+    jitter_window: int = Field(0, ge=0, description="打散窗口（秒），在该时间内均匀下发")
+    rate: float = Field(0, ge=0, description="下发速率上限（条/秒），0 表示不限")
+    retry_on_reconnect: bool = Field(True, description="离线设备上线后是否重试")
+    retry_ttl: int = Field(3600, ge=0, description="离线设备的最长等待时间（秒），从开始时间起算")
+
+class ScheduleJobStatus(BaseModel):
+    """定时任务进度"""
+    job_id: str = Field("", description="任务ID")
+    state: ScheduleJobState = Field(ScheduleJobState.SCHEDULED, description="任务状态")
+    event: str = Field("", description="控制事件")
+    start_at: int = Field(0, description="开始时间")
+    total: int = Field(0, description="目标设备数")
+    sent: int = Field(0, description="已下发数")
+    pending: int = Field(0, description="待下发数")
+    waiting: int = Field(0, description="等待上线重试数")
+    failed: int = Field(0, description="下发失败数")
+    expired: int = Field(0, description="等待超时数")
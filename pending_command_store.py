@@ -0,0 +1,109 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Tuple
+import orjson
+
+
+logger = logging.getLogger(__name__)
+
+
+class PendingCommand(NamedTuple):
+    """待下发命令"""
+    expire_at: float
+    message: dict
+    size: int
+
+
+'''
+离线设备的待下发命令存储：
+- 同一设备的同一事件只保留最新的命令
+- 每条命令有过期时间，设备数量和总内存都有上限，超限时淘汰最早入队的命令
+'''
+class PendingCommandStore:
+    # 构造函数
+    def __init__(self, max_per_device: int, max_bytes: int):
+        self._max_per_device = max_per_device
+        self._max_bytes = max_bytes
+        # (设备ID, 事件) -> 命令，按入队顺序排列，用于全局淘汰
+        self._commands: "OrderedDict[Tuple[str, str], PendingCommand]" = OrderedDict()
+        # 设备ID -> 事件（按入队顺序），用于按设备取出
+        self._device_events: Dict[str, "OrderedDict[str, None]"] = {}
+        self._bytes = 0
+        # 统计
+        self.queued = 0
+        self.replaced = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    # 入队
+    def put(self, device_id: str, message: dict, ttl: float) -> bool:
+        """保存命令，同一设备同一事件的旧命令被替换；命令本身超过内存上限时返回 False"""
+        size = len(orjson.dumps(message))
+        if size > self._max_bytes:
+            return False
+
+        event = str(message.get("event", ""))
+        key = (device_id, event)
+        if key in self._commands:
+            self._remove(key)
+            self.replaced += 1
+
+        self._commands[key] = PendingCommand(time.time() + ttl, message, size)
+        self._device_events.setdefault(device_id, OrderedDict())[event] = None
+        self._bytes += size
+        self.queued += 1
+
+        # 单设备上限：淘汰该设备最早的命令
+        events = self._device_events[device_id]
+        while len(events) > self._max_per_device:
+            self._remove((device_id, next(iter(events))))
+            self.evicted += 1
+
+        # 全局内存上限：淘汰全局最早的命令
+        while self._bytes > self._max_bytes:
+            self._remove(next(iter(self._commands)))
+            self.evicted += 1
+        return True
+
+    # 取出设备的全部命令
+    def pop_device(self, device_id: str) -> List[PendingCommand]:
+        """按入队顺序取出设备未过期的命令"""
+        events = self._device_events.pop(device_id, None)
+        if not events:
+            return []
+        now = time.time()
+        commands = []
+        for event in events:
+            command = self._commands.pop((device_id, event))
+            self._bytes -= command.size
+            if command.expire_at > now:
+                commands.append(command)
+            else:
+                self.expired += 1
+        return commands
+
+    # 清理过期命令
+    def purge_expired(self) -> int:
+        now = time.time()
+        expired_keys = [key for key, command in self._commands.items() if command.expire_at <= now]
+        for key in expired_keys:
+            self._remove(key)
+        self.expired += len(expired_keys)
+        return len(expired_keys)
+
+    def _remove(self, key: Tuple[str, str]):
+        command = self._commands.pop(key)
+        self._bytes -= command.size
+        device_id, event = key
+        events = self._device_events[device_id]
+        del events[event]
+        if not events:
+            del self._device_events[device_id]
@@ -0,0 +1,268 @@
+# 连接抖动浸泡测试：用固定的设备ID池反复连接、断开、强杀、重复连接，检测内存、任务和连接表是否无界增长
+# 用法: python soak_churn.py [--duration 3600] [--devices 2000] [--concurrency 200]
+import os
+import gc
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+from typing import Dict, List, Tuple
+
+os.environ.setdefault("VIDEO_RTMP_HOST", "127.0.0.1")
+os.environ.setdefault("VIDEO_RTMP_PORT", "1935")
+os.environ.setdefault("DEBUG", "false")
+
+import uvicorn
+from websockets.asyncio.client import connect as ws_connect
+from websockets.exceptions import WebSocketException
+from main import app
+from connection_manager import connectionManager
+from command_scheduler import commandScheduler
+from bench_runtime import free_port
+from utils import generate_uuid
+
+
+SCENARIOS = ("graceful", "kill", "duplicate", "power_off", "bad_message")
+
+# 当前进程常驻内存（KB）
+def current_rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# 最小二乘拟合的斜率
+def fit_slope(points: List[Tuple[float, float]]) -> float:
+    count = len(points)
+    mean_x = sum(x for x, _ in points) / count
+    mean_y = sum(y for _, y in points) / count
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+# 连接管理器及相关子系统的表大小
+def table_sizes() -> Dict[str, int]:
+    return {
+        "connections": len(connectionManager._connections),
+        "device_status": len(connectionManager._device_status),
+        "device_generation": len(connectionManager._device_generation),
+        "snapshot_cache": len(connectionManager._snapshot_cache),
+        "device_poller": len(connectionManager._device_poller._states),
+        "removed_generation": len(connectionManager._removed_generation),
+        "pending_commands": len(connectionManager._pending_commands),
+        "scheduler_waiting": len(commandScheduler._waiting),
+    }
+
+# 必须在每轮结束后归零的表
+MUST_DRAIN = ("connections", "device_status", "device_generation", "snapshot_cache", "device_poller")
+
+
+'''
+模拟设备
+'''
+class SimulatedDevice:
+    # 构造函数
+    def __init__(self, base_url: str, device_id: str):
+        self.device_id = device_id
+        self.url = f"{base_url}/api/ws/v1/manyRoom/soak/{device_id[:16]}/device/{device_id}/zh-CN"
+
+    def _message(self, type: str, event: str, **extra) -> str:
+        return json.dumps({"type": type, "event": event, "deviceId": self.device_id, "playId": self.device_id, **extra})
+
+    # 正常连接、上报、请求、关闭
+    async def graceful(self):
+        async with ws_connect(self.url, ping_interval=None) as ws:
+            await ws.send(self._message("notify", "join"))
+            await ws.send(self._message("notify", "device_info", data={"led": random.randint(0, 1)}))
+            await ws.send(self._message("device_control", "get_rtmp"))
+            await asyncio.wait_for(ws.recv(), timeout=10)
+
+    # 不发送关闭帧直接断开 TCP
+    async def kill(self):
+        ws = await ws_connect(self.url, ping_interval=None)
+        await ws.send(self._message("notify", "join"))
+        ws.transport.abort()
+
+    # 旧连接未断开时同一设备再次连接
+    async def duplicate(self):
+        first = await ws_connect(self.url, ping_interval=None)
+        second = await ws_connect(self.url, ping_interval=None)
+        await second.send(self._message("notify", "join"))
+        await first.close()
+        await second.close()
+
+    # 设备请求关机，等待服务端关闭连接
+    async def power_off(self):
+        async with ws_connect(self.url, ping_interval=None) as ws:
+            await ws.send(self._message("device_control", "power_off"))
+            await asyncio.wait_for(ws.wait_closed(), timeout=10)
+
+    # 发送非法消息（校验失败、非 JSON）
+    async def bad_message(self):
+        async with ws_connect(self.url, ping_interval=None) as ws:
+            await ws.send(json.dumps({"type": "bogus", "event": "nope"}))
+            await asyncio.wait_for(ws.recv(), timeout=10)
+            await ws.send("not json")
+            await asyncio.wait_for(ws.wait_closed(), timeout=10)
+
+'''
+浸泡测试
+'''
+class ChurnSoak:
+    # 构造函数
+    def __init__(self, args):
+        self.args = args
+        self.device_ids = [generate_uuid() for _ in range(args.devices)]
+        self.samples: List[Dict[str, float]] = []
+        self.failures: List[str] = []
+        self.client_errors = 0
+        self.baseline_tasks = 0
+        # 预热时长：分配器和各类缓存在此期间增长到稳定水平，不参与内存增长检查
+        self.warmup = args.warmup if args.warmup is not None else args.duration / 2
+        self.warmup_snapshot = None
+
+    # 一轮抖动
+    async def churn_round(self, base_url: str):
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def run_one(device_id: str):
+            scenario = random.choice(SCENARIOS)
+            async with semaphore:
+                try:
+                    await getattr(SimulatedDevice(base_url, device_id), scenario)()
+                except (WebSocketException, OSError, asyncio.TimeoutError):
+                    self.client_errors += 1
+
+        await asyncio.gather(*(run_one(device_id) for device_id in self.device_ids))
+
+    # 等待服务端处理完断开
+    async def settle(self):
+        deadline = time.monotonic() + self.args.settle_timeout
+        while time.monotonic() < deadline:
+            if not connectionManager._connections and not connectionManager._device_status:
+                break
+            await asyncio.sleep(0.1)
+        # 让已结束连接的任务完成收尾
+        await asyncio.sleep(0.5)
+
+    # 采样并检查
+    def checkpoint(self, round_index: int, elapsed: float):
+        gc.collect()
+        sample = {
+            "round": round_index,
+            "elapsed": elapsed,
+            "rss_kb": current_rss_kb(),
+            "traced_kb": tracemalloc.get_traced_memory()[0] // 1024,
+            "tasks": len(asyncio.all_tasks()),
+            **table_sizes(),
+        }
+        self.samples.append(sample)
+        print(
+            f"[{elapsed:8.0f}s] 第 {round_index} 轮: RSS {sample['rss_kb']} KB, traced {sample['traced_kb']} KB, "
+            f"任务 {sample['tasks']}, 连接 {sample['connections']}, 状态 {sample['device_status']}, "
+            f"断开记录 {sample['removed_generation']}, 客户端错误 {self.client_errors}",
+            flush=True,
+        )
+
+        for name in MUST_DRAIN:
+            if sample[name]:
+                self.failures.append(f"第 {round_index} 轮结束后 {name} 仍有 {sample[name]} 项")
+        if sample["tasks"] > self.baseline_tasks + self.args.task_tolerance:
+            self.failures.append(f"第 {round_index} 轮结束后任务数 {sample['tasks']}，基线 {self.baseline_tasks}")
+
+    # 内存增长检查：对预热后的采样拟合增长趋势，整体和后半段都超过上限才视为持续增长
+    # （分配器预热后进入平台期时，后半段趋势接近 0，不会误报）
+    def check_growth(self):
+        series = [s for s in self.samples if s["elapsed"] >= self.warmup]
+        if len(series) < 8:
+            print(f"预热（{self.warmup:.0f} 秒）后采样不足 8 个，跳过内存增长检查")
+            return
+        span = series[-1]["elapsed"] - series[0]["elapsed"]
+        recent = series[len(series) // 2:]
+        for key, limit_kb in (("rss_kb", self.args.max_rss_growth_mb * 1024),
+                              ("traced_kb", self.args.max_traced_growth_mb * 1024)):
+            # 斜率折算为整个检查窗口内的增长量
+            overall = fit_slope([(s["elapsed"], s[key]) for s in series]) * span
+            trend = fit_slope([(s["elapsed"], s[key]) for s in recent]) * span
+            print(f"{key}: 预热后 {len(series)} 个采样（{span:.0f} 秒），整体趋势 {overall:+.0f} KB，"
+                  f"后半段趋势 {trend:+.0f} KB（上限 {limit_kb:.0f} KB）")
+            if overall > limit_kb and trend > limit_kb:
+                self.failures.append(f"{key} 持续增长：整体趋势 {overall:+.0f} KB，后半段趋势 {trend:+.0f} KB，超过上限 {limit_kb:.0f} KB")
+
+    # 输出预热后新增内存最多的代码位置
+    def report_top_allocations(self):
+        if self.warmup_snapshot is None:
+            return
+        snapshot = tracemalloc.take_snapshot()
+        print("\n预热后内存增长最多的位置:")
+        for stat in snapshot.compare_to(self.warmup_snapshot, "lineno")[:10]:
+            print(f"  {stat}")
+
+    async def run(self) -> bool:
+        port = free_port()
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+        server = uvicorn.Server(config)
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        base_url = f"ws://127.0.0.1:{port}"
+
+        tracemalloc.start(self.args.traceback_frames)
+        gc.collect()
+        self.baseline_tasks = len(asyncio.all_tasks())
+        start = time.monotonic()
+        round_index = 0
+        try:
+            while True:
+                elapsed = time.monotonic() - start
+                if elapsed >= self.args.duration:
+                    break
+                round_index += 1
+                await self.churn_round(base_url)
+                await self.settle()
+                elapsed = time.monotonic() - start
+                self.checkpoint(round_index, elapsed)
+                if self.warmup_snapshot is None and elapsed >= self.warmup:
+                    self.warmup_snapshot = tracemalloc.take_snapshot()
+                if self.failures and self.args.fail_fast:
+                    break
+            self.check_growth()
+            self.report_top_allocations()
+        finally:
+            server.should_exit = True
+            await server_task
+            tracemalloc.stop()
+
+        if self.failures:
+            print("\n浸泡测试失败:")
+            for failure in self.failures:
+                print(f"  - {failure}")
+            return False
+        print(f"\n浸泡测试通过: {round_index} 轮，每轮 {self.args.devices} 台设备")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="连接抖动浸泡测试")
+    parser.add_argument("--duration", type=float, default=300, help="测试时长（秒）")
+    parser.add_argument("--devices", type=int, default=500, help="设备ID池大小（每轮每个ID执行一次随机场景）")
+    parser.add_argument("--concurrency", type=int, default=100, help="并发设备数")
+    parser.add_argument("--warmup", type=float, default=None, help="预热时长（秒，不参与内存增长检查），默认为测试时长的一半")
+    parser.add_argument("--settle-timeout", type=float, default=15, help="每轮结束后等待服务端清理的时间（秒）")
+    parser.add_argument("--task-tolerance", type=int, default=5, help="允许超出基线的任务数")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=20, help="允许的 RSS 增长（MB）")
+    parser.add_argument("--max-traced-growth-mb", type=float, default=5, help="允许的 Python 堆增长（MB）")
+    parser.add_argument("--traceback-frames", type=int, default=1, help="tracemalloc 记录的调用栈深度")
+    parser.add_argument("--fail-fast", action="store_true", help="发现泄漏后立即停止")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(ChurnSoak(args).run()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# 启动耗时报告：统计 main 模块的导入耗时明细
+# 用法: python startup_report.py [--top 20]
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+
+IMPORT_TIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+# 解析 -X importtime 的输出
+def parse_import_times(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """返回 (模块名, 自身耗时us, 累计耗时us, 嵌套层级) 列表"""
+    records = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return records
+
+# 按顶层包汇总自身耗时
+def group_by_package(records: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """按顶层包名汇总自身耗时（us）"""
+    groups: Dict[str, int] = {}
+    for module, self_us, _, _ in records:
+        package = module.split(".")[0]
+        groups[package] = groups.get(package, 0) + self_us
+    return groups
+
+def main():
+    parser = argparse.ArgumentParser(description="统计服务启动时的模块导入耗时")
+    parser.add_argument("--module", default="main", help="要导入的模块")
+    parser.add_argument("--top", type=int, default=20, help="显示耗时最高的前 N 项")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # 导入 config 需要必填配置项，未设置时使用占位值
+    env.setdefault("VIDEO_RTMP_HOST", "127.0.0.1")
+    env.setdefault("VIDEO_RTMP_PORT", "1935")
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {args.module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        sys.exit(result.returncode)
+
+    records = parse_import_times(result.stderr)
+    total_us = sum(self_us for _, self_us, _, _ in records)
+
+    print(f"进程总耗时（含解释器启动）: {wall_ms:.1f} ms")
+    print(f"模块导入总耗时: {total_us / 1000:.1f} ms, 模块数: {len(records)}")
+
+    print(f"\n按顶层包汇总（前 {args.top}）:")
+    groups = sorted(group_by_package(records).items(), key=lambda item: item[1], reverse=True)
+    for package, self_us in groups[:args.top]:
+        print(f"  {package:<32} {self_us / 1000:>9.1f} ms  {self_us * 100 / total_us:>5.1f}%")
+
+    print(f"\n{args.module} 及其直接导入模块的累计耗时:")
+    # 子模块先于父模块输出：从目标模块向前回溯到上一个顶层记录为止
+    target = next(i for i, record in enumerate(records) if record[0] == args.module and record[3] == 0)
+    children = []
+    for module, _, cumulative_us, level in reversed(records[:target]):
+        if level == 0:
+            break
+        if level == 1:
+            children.append((module, cumulative_us))
+    for module, cumulative_us in sorted(children, key=lambda item: item[1], reverse=True):
+        print(f"  {module:<32} {cumulative_us / 1000:>9.1f} ms")
+    print(f"  {args.module + '（合计）':<32} {records[target][2] / 1000:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
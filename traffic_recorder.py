@@ -0,0 +1,175 @@
+import os
+import time
+import struct
+import asyncio
+import logging
+from enum import IntEnum
+from typing import Iterator, List, NamedTuple, Optional
+import orjson
+
+
+logger = logging.getLogger(__name__)
+
+# 日志文件格式：文件头 + 若干记录
+# 文件头: MAGIC(4) + 版本(1)
+# 记录头: 时间戳 float64 + 方向 uint8 + 设备ID长度 uint16 + 负载长度 uint32，其后为设备ID与 JSON 负载
+LOG_MAGIC = b"DRTC"
+LOG_VERSION = 1
+_FILE_HEADER = LOG_MAGIC + bytes([LOG_VERSION])
+_RECORD_HEADER = struct.Struct("<dBHI")
+
+
+class FrameDirection(IntEnum):
+    """帧方向枚举"""
+    INBOUND = 0     # 设备->系统
+    OUTBOUND = 1    # 系统->设备
+    CONNECT = 2     # 设备建立连接（负载为连接参数）
+    DISCONNECT = 3  # 设备断开连接
+
+
+class TrafficRecord(NamedTuple):
+    """流量记录"""
+    timestamp: float
+    direction: FrameDirection
+    device_id: str
+    payload: dict
+
+
+# 编码单条记录
+def encode_record(timestamp: float, direction: FrameDirection, device_id: str, payload: dict) -> bytes:
+    device_bytes = device_id.encode("utf-8")
+    payload_bytes = orjson.dumps(payload)
+    return _RECORD_HEADER.pack(timestamp, direction, len(device_bytes), len(payload_bytes)) + device_bytes + payload_bytes
+
+# 读取流量日志
+def read_records(path: str) -> Iterator[TrafficRecord]:
+    """按写入顺序读取流量日志中的记录（末尾不完整的记录会被忽略）"""
+    with open(path, "rb") as f:
+        header = f.read(len(_FILE_HEADER))
+        if header[:len(LOG_MAGIC)] != LOG_MAGIC:
+            raise ValueError(f"不是有效的流量日志: {path}")
+        if header[len(LOG_MAGIC)] != LOG_VERSION:
+            raise ValueError(f"不支持的流量日志版本: {header[len(LOG_MAGIC)]}")
+        while True:
+            record_header = f.read(_RECORD_HEADER.size)
+            if len(record_header) < _RECORD_HEADER.size:
+                return
+            timestamp, direction, device_len, payload_len = _RECORD_HEADER.unpack(record_header)
+            body = f.read(device_len + payload_len)
+            if len(body) < device_len + payload_len:
+                return
+            yield TrafficRecord(
+                timestamp,
+                FrameDirection(direction),
+                body[:device_len].decode("utf-8"),
+                orjson.loads(body[device_len:]),
+            )
+
+
+'''
+设备流量记录器：热路径只做内存追加，由后台任务批量（group commit）写盘
+'''
+class TrafficRecorder:
+    # 构造函数
+    def __init__(self):
+        # 是否启用（热路径只检查该标志）
+        self.enabled = False
+        # 待写入的已编码记录
+        self._buffer: List[bytes] = []
+        self._buffer_bytes = 0
+        # 写盘唤醒事件
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._file = None
+        # 提交窗口（秒）与缓冲上限（字节）
+        self._flush_interval = 0.05
+        self._max_buffer = 16 * 1024 * 1024
+        # 统计
+        self.recorded = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    # 启动记录器
+    async def start(self, path: str, flush_interval: float, max_buffer: int):
+        """打开日志文件并启动后台写盘任务"""
+        if self.enabled:
+            return
+        self._flush_interval = flush_interval
+        self._max_buffer = max_buffer
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new_file:
+            self._file.write(_FILE_HEADER)
+            self._file.flush()
+        self._wakeup = asyncio.Event()
+        self._writer_task = asyncio.create_task(self._writer_loop())
+        self.enabled = True
+        logger.info(f"流量记录已启动: {path}")
+
+    # 停止记录器
+    async def stop(self):
+        """停止后台写盘任务，写出剩余记录并关闭文件"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        # 唤醒写盘任务，由其写出剩余记录后退出
+        self._wakeup.set()
+        await self._writer_task
+        self._writer_task = None
+        await self._flush()
+        self._file.close()
+        self._file = None
+        logger.info(f"流量记录已停止: 记录 {self.recorded} 条，丢弃 {self.dropped} 条，写盘 {self.flushes} 次")
+
+    # 记录一帧
+    def record(self, direction: FrameDirection, device_id: str, payload: dict):
+        """追加一条记录（不阻塞，缓冲区超限时丢弃）"""
+        if not self.enabled:
+            return
+        if self._buffer_bytes >= self._max_buffer:
+            self.dropped += 1
+            return
+        try:
+            data = encode_record(time.time(), direction, device_id, payload)
+        except TypeError as e:
+            logger.error(f"流量记录编码失败: {e}")
+            self.dropped += 1
+            return
+        self._buffer.append(data)
+        self._buffer_bytes += len(data)
+        self.recorded += 1
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    # 后台写盘循环
+    async def _writer_loop(self):
+        while True:
+            await self._wakeup.wait()
+            if self.enabled:
+                # 等待一个提交窗口，把窗口内的记录合并为一次写盘
+                await asyncio.sleep(self._flush_interval)
+            self._wakeup.clear()
+            try:
+                await self._flush()
+            except OSError as e:
+                logger.error(f"流量记录写盘失败: {e}")
+            if not self.enabled:
+                return
+
+    # 写出缓冲区
+    async def _flush(self):
+        if not self._buffer:
+            return
+        batch = b"".join(self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+        await asyncio.to_thread(self._write, batch)
+        self.flushes += 1
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._file.flush()
+
+
+# 全局流量记录器
+trafficRecorder = TrafficRecorder()
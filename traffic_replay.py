@@ -0,0 +1,205 @@
+# 流量回放工具：按录制时序（或加速）把流量日志重新驱动到本地服务，并统计每条消息的响应延迟
+# 用法: python traffic_replay.py traffic.log [--server 127.0.0.1:9001] [--speed 1.0]
+import time
+import asyncio
+import argparse
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Tuple
+import aiohttp
+from traffic_recorder import FrameDirection, TrafficRecord, read_records
+
+
+# 设备对请求的响应类型
+RESPONSE_TYPES = ("device_notify", "message")
+# 服务端自行发起的控制（心跳轮询），不属于云控，回放时不重放
+SERVER_INITIATED_EVENTS = ("device_info",)
+
+# 百分位数
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+# 标记需要等待响应的上行消息
+def mark_expected_responses(records: List[TrafficRecord]) -> List[bool]:
+    """录制中紧随其后（下一条上行前）出现同 event 响应的上行消息，回放时统计其延迟"""
+    expects = [False] * len(records)
+    for i, record in enumerate(records):
+        if record.direction != FrameDirection.INBOUND or not isinstance(record.payload, dict):
+            continue
+        for later in records[i + 1:]:
+            if later.direction == FrameDirection.INBOUND:
+                break
+            if (later.direction == FrameDirection.OUTBOUND
+                    and later.payload.get("type") in RESPONSE_TYPES
+                    and later.payload.get("event") == record.payload.get("event")):
+                expects[i] = True
+                break
+    return expects
+
+
+'''
+流量回放器
+'''
+class TrafficReplayer:
+    # 构造函数
+    def __init__(self, server: str, speed: float, wss_prefix: str, api_prefix: str, drain_timeout: float):
+        self._ws_base = f"ws://{server}{wss_prefix}"
+        self._control_url = f"http://{server}{api_prefix}/cloud-control"
+        self._speed = speed
+        self._drain_timeout = drain_timeout
+        self._origin = 0.0
+        self._start = 0.0
+        # 延迟统计（秒），按 "设备请求:event" / "云控:event" 分类
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.unanswered: Dict[str, int] = defaultdict(int)
+        self.errors = 0
+        self.sent = 0
+
+    # 等待到录制时刻（按倍速换算）
+    async def _wait_until(self, timestamp: float):
+        if self._speed <= 0:
+            return
+        delay = self._start + (timestamp - self._origin) / self._speed - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    # 回放单个设备的会话
+    async def _replay_device(self, session: aiohttp.ClientSession, device_id: str, records: List[TrafficRecord]):
+        expects = mark_expected_responses(records)
+        pending: Dict[str, Deque[Tuple[str, float]]] = defaultdict(deque)
+        ws = None
+        receiver = None
+        control_tasks = []
+
+        async def receive_loop(websocket: aiohttp.ClientWebSocketResponse):
+            async for msg in websocket:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                frame = msg.json()
+                if frame.get("type") == "control":
+                    queue = pending.get(f"control:{frame.get('event')}")
+                elif frame.get("type") in RESPONSE_TYPES:
+                    queue = pending.get(f"response:{frame.get('event')}")
+                else:
+                    queue = None
+                if queue:
+                    key, sent_at = queue.popleft()
+                    self.latencies[key].append(time.monotonic() - sent_at)
+
+        async def post_control(payload: dict):
+            # 云控延迟：从发起 HTTP 请求到设备收到控制帧
+            key = f"云控:{payload.get('event')}"
+            pending[f"control:{payload.get('event')}"].append((key, time.monotonic()))
+            try:
+                async with session.post(self._control_url, json=payload) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        self.errors += 1
+            except aiohttp.ClientError:
+                self.errors += 1
+
+        async def close():
+            nonlocal ws
+            if ws is None:
+                return
+            # 等待未完成的响应
+            deadline = time.monotonic() + self._drain_timeout
+            while any(pending.values()) and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            await ws.close()
+            await receiver
+            ws = None
+            # 超时仍未响应的消息计入未响应
+            for queue in pending.values():
+                for key, _ in queue:
+                    self.unanswered[key] += 1
+            pending.clear()
+
+        for index, record in enumerate(records):
+            await self._wait_until(record.timestamp)
+            if record.direction == FrameDirection.CONNECT:
+                await close()
+                params = record.payload
+                url = (f"{self._ws_base}/manyRoom/{params.get('room_id', 'replay')}/{params.get('device_sn', '')}"
+                       f"/device/{device_id}/{params.get('language', 'zh-CN')}")
+                try:
+                    ws = await session.ws_connect(url, heartbeat=None)
+                except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+                    self.errors += 1
+                    continue
+                receiver = asyncio.create_task(receive_loop(ws))
+            elif record.direction == FrameDirection.DISCONNECT:
+                await close()
+            elif ws is None:
+                continue
+            elif record.direction == FrameDirection.INBOUND:
+                if expects[index]:
+                    pending[f"response:{record.payload.get('event')}"].append(
+                        (f"设备请求:{record.payload.get('event')}", time.monotonic())
+                    )
+                try:
+                    await ws.send_json(record.payload)
+                    self.sent += 1
+                except (aiohttp.ClientError, ConnectionResetError):
+                    self.errors += 1
+            elif (record.payload.get("type") == "control"
+                    and record.payload.get("event") not in SERVER_INITIATED_EVENTS):
+                control_tasks.append(asyncio.create_task(post_control(record.payload)))
+
+        await asyncio.gather(*control_tasks)
+        await close()
+
+    # 回放整份日志
+    async def replay(self, records: List[TrafficRecord]):
+        by_device: Dict[str, List[TrafficRecord]] = defaultdict(list)
+        for record in records:
+            by_device[record.device_id].append(record)
+        self._origin = records[0].timestamp
+        self._start = time.monotonic()
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await asyncio.gather(*(
+                self._replay_device(session, device_id, device_records)
+                for device_id, device_records in by_device.items()
+            ))
+        return time.monotonic() - self._start
+
+    # 输出报告
+    def report(self, elapsed: float):
+        print(f"回放耗时 {elapsed:.2f} s，发送上行消息 {self.sent} 条，错误 {self.errors} 次")
+        print("\n| 消息 | 数量 | 平均(ms) | p50(ms) | p95(ms) | p99(ms) | 最大(ms) | 未响应 |")
+        print("|------|-----:|--------:|--------:|--------:|--------:|--------:|------:|")
+        for key in sorted(set(self.latencies) | set(self.unanswered)):
+            values = [v * 1000 for v in self.latencies.get(key, [])]
+            if values:
+                print(
+                    f"| {key} | {len(values)} | {sum(values) / len(values):.2f} | {percentile(values, 50):.2f} "
+                    f"| {percentile(values, 95):.2f} | {percentile(values, 99):.2f} | {max(values):.2f} "
+                    f"| {self.unanswered.get(key, 0)} |"
+                )
+            else:
+                print(f"| {key} | 0 | - | - | - | - | - | {self.unanswered.get(key, 0)} |")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="回放设备流量日志并统计响应延迟")
+    parser.add_argument("log", help="流量日志文件（TRAFFIC_RECORD_PATH 录制）")
+    parser.add_argument("--server", default="127.0.0.1:9001", help="被测服务地址 host:port")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，1 为原始时序，0 为不等待尽快发送")
+    parser.add_argument("--wss-prefix", default="/api/ws/v1", help="WebSocket API 前缀")
+    parser.add_argument("--api-prefix", default="/api/v1", help="云控 API 前缀")
+    parser.add_argument("--drain-timeout", type=float, default=5.0, help="断开前等待未完成响应的时间（秒）")
+    args = parser.parse_args()
+
+    records = list(read_records(args.log))
+    if not records:
+        print("流量日志为空")
+        return
+    replayer = TrafficReplayer(args.server, args.speed, args.wss_prefix, args.api_prefix, args.drain_timeout)
+    elapsed = await replayer.replay(records)
+    replayer.report(elapsed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())